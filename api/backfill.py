@@ -0,0 +1,97 @@
+"""
+One-time migration of legacy rows to the charges/total schema.
+
+    python -m api.backfill --status           # how many rows still need it
+    python -m api.backfill --dry-run          # print what would change
+    python -m api.backfill --batch-size 500   # migrate, checkpointing after every chunk
+
+Interrupted runs resume from the checkpoint file; pass --restart to start over.
+Once --status reports 0, set LEGACY_SCHEMA_MIGRATED=1 so the read paths skip the conversion.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple
+from .db_manager import (
+    client_from_env,
+    fetch_rows_needing_migration,
+    count_rows_needing_migration,
+    store_charges_and_total,
+    convert_legacy_charges,
+)
+from .helpers import compute_total_from_charges
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+DEFAULT_CHECKPOINT = ".backfill_checkpoint.json"
+
+def migrated_values(row: Dict[str, Any]) -> tuple[List[Dict[str, Any]], float]:
+    """Returns the charges array and total a legacy row should store."""
+    charges = row.get("charges") or convert_legacy_charges(row)
+    total = row.get("total")
+    if total is None:
+        total = compute_total_from_charges(charges)
+    return charges, total
+
+def load_checkpoint(path: str) -> int:
+    try:
+        with open(path) as f:
+            return int(json.load(f).get("last_id", 0))
+    except FileNotFoundError:
+        return 0
+
+def save_checkpoint(path: str, last_id: int) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"last_id": last_id}, f)
+    os.replace(tmp, path)
+
+def run_backfill(supabase: Client, batch_size: int = 500, dry_run: bool = False,
+                 checkpoint: str | None = DEFAULT_CHECKPOINT, start_after: int = 0) -> Tuple[int, int]:
+    """
+    Migrates (or, with dry_run, reports) every legacy row after `start_after`.
+    Rows saved by someone else since they were read are left alone. Returns (migrated, skipped).
+    """
+    last_id, done, skipped = start_after, 0, 0
+    while True:
+        rows = fetch_rows_needing_migration(supabase, after_id=last_id, limit=batch_size)
+        if not rows:
+            break
+        for row in rows:
+            charges, total = migrated_values(row)
+            if dry_run:
+                print(f"#{row['id']}: charges {json.dumps(row.get('charges'))} -> {json.dumps(charges)}; "
+                      f"total {row.get('total')} -> {total:.2f}")
+            elif not store_charges_and_total(supabase, row["id"], row["version"], charges, total):
+                skipped += 1
+                continue
+            done += 1
+        last_id = rows[-1]["id"]
+        if checkpoint and not dry_run:
+            save_checkpoint(checkpoint, last_id)
+        print(f"{'Checked' if dry_run else 'Migrated'} {done} rows (up to id {last_id})"
+              + (f", skipped {skipped} edited meanwhile" if skipped else ""))
+    return done, skipped
+
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Backfill legacy pdf_records rows into the charges/total schema.")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true", help="print the changes without writing them")
+    parser.add_argument("--status", action="store_true", help="only report how many rows still need migrating")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT)
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    args = parser.parse_args(argv)
+
+    supabase = client_from_env()
+    if args.status:
+        print(f"Rows needing migration: {count_rows_needing_migration(supabase)}")
+        return
+    start_after = 0 if args.restart or args.dry_run else load_checkpoint(args.checkpoint)
+    migrated, skipped = run_backfill(supabase, args.batch_size, args.dry_run, args.checkpoint, start_after)
+    if not args.dry_run:
+        print(f"✅ Done: {migrated} rows migrated, {skipped} skipped, {count_rows_needing_migration(supabase)} remaining")
+
+if __name__ == "__main__":
+    main()
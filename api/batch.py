@@ -0,0 +1,111 @@
+import io
+import multiprocessing
+import os
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Deque, Dict, Any, Iterable, Iterator, Tuple
+from .pdf_generator import fill_pdf_with_overlay
+
+# Process pool shared by /export and render jobs (see get_pool); 0 workers means not created yet.
+_pool: Executor | None = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+def _render_one(template_path: str, data: Dict[str, Any]) -> bytes:
+    """Process pool entry point: renders one invoice and returns the raw PDF bytes."""
+    return fill_pdf_with_overlay(template_path, data).getvalue()
+
+def _make_pool(workers: int) -> Executor | None:
+    """Creates a process pool, or returns None where the platform cannot provide one."""
+    try:
+        # Spawned rather than forked: the pool is started from request and job threads, and a
+        # forked child would inherit whatever locks (template cache, sqlite) they hold at that moment.
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    except (OSError, NotImplementedError, ImportError):
+        # e.g. serverless sandboxes without /dev/shm for multiprocessing semaphores
+        return None
+
+def default_workers() -> int:
+    return int(os.environ.get("EXPORT_WORKERS", 0)) or os.cpu_count() or 1
+
+def get_pool() -> Tuple[Executor | None, int]:
+    """The process pool shared by /export and render jobs and its size, created on first use."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool_workers == 0:
+            _pool_workers = default_workers()
+            _pool = _make_pool(_pool_workers) if _pool_workers > 1 else None
+        return _pool, _pool_workers
+
+def _discard_pool(pool: Executor) -> None:
+    """Drops a broken shared pool so the next render starts a new one."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is pool:
+            _pool, _pool_workers = None, 0
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def render_pdfs(template_path: str, records: Iterable[Dict[str, Any]], workers: int | None = None) -> Iterator[bytes]:
+    """
+    Renders each record to PDF bytes, yielding results in input order.
+    Rendering is spread over a process pool; at most two renders per worker are in flight.
+    Without `workers` the shared pool (EXPORT_WORKERS, default every core) is used; with it,
+    a pool of that size is started for this call and shut down at the end.
+    """
+    if workers is None:
+        pool, workers = get_pool()
+        own_pool = False
+    else:
+        pool, own_pool = (_make_pool(workers) if workers > 1 else None), True
+    if pool is None:
+        for data in records:
+            yield _render_one(template_path, data)
+        return
+    pending: Deque[Future] = deque()
+    try:
+        for data in records:
+            pending.append(pool.submit(_render_one, template_path, data))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    except BrokenProcessPool:
+        if not own_pool:
+            _discard_pool(pool)
+        raise
+    finally:
+        # A consumer that stops early (e.g. a dropped download) must not leave renders queued.
+        for future in pending:
+            future.cancel()
+        if own_pool:
+            pool.shutdown()
+
+class _ChunkSink(io.RawIOBase):
+    """Unseekable write target that collects whatever zipfile writes until drained."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self.chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def stream_zip(named_pdfs: Iterable[Tuple[str, bytes]]) -> Iterator[bytes]:
+    """Yields a ZIP archive of (filename, pdf bytes) pairs entry by entry."""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as zf:
+        for filename, pdf in named_pdfs:
+            zf.writestr(filename, pdf)
+            yield sink.drain()
+    yield sink.drain()
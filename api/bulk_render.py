@@ -0,0 +1,230 @@
+"""
+Offline batch rendering of invoices, without the web app.
+
+    python -m api.bulk_render --input invoices.jsonl --output out/         # one PDF per record
+    python -m api.bulk_render --input export.csv --output invoices.zip
+    python -m api.bulk_render --from-db --date-from 2025-03-01 --date-to 2025-03-31 --output march.pdf
+
+Records come from a CSV / JSON Lines file (validated like the importer) or straight from
+the database in pages. They are rendered with fill_pdf_with_overlay on a process pool
+(--workers, default every core). The output is a directory of PDFs, or a .zip / merged .pdf
+assembled from per-record parts once every record is rendered. Progress is checkpointed,
+so an interrupted run resumes where it stopped; pass --restart to start over.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from collections import deque
+from datetime import timedelta
+from typing import TYPE_CHECKING, Any, Deque, Dict, Iterable, Iterator, List, Tuple
+from .batch import render_pdfs, stream_zip
+from .db_manager import client_from_env, count_records, fetch_page, row_to_pdf_record
+from .helpers import pdf_filename
+from .importer import detect_format, iter_rows, normalize_row
+from .pdf_stream import stream_merged_pdf
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+DEFAULT_TEMPLATE = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "template.pdf"))
+DEFAULT_PAGE_SIZE = 200
+DEFAULT_CHECKPOINT_EVERY = 50
+PROGRESS_SECONDS = 5.0
+
+# (position in the source, output key, record for the PDF generator). The position is the
+# line number for files and the record id for the database (read in descending id order).
+SourceRecord = Tuple[int, str, Dict[str, Any]]
+
+def file_records(path: str, fmt: str, start_after: int = 0) -> Iterator[SourceRecord]:
+    """Validated records of a CSV / JSON Lines file after line `start_after`. Invalid rows are reported and skipped."""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for line_no, row, error in iter_rows(f, fmt):
+            if line_no <= start_after:
+                continue
+            if error is None:
+                try:
+                    record = normalize_row(row)
+                except (ValueError, TypeError) as e:
+                    error = str(e)
+            if error is not None:
+                print(f"❌ line {line_no}: {error}", file=sys.stderr)
+                continue
+            yield line_no, str(row.get("id") or line_no), record
+
+def count_file_records(path: str, fmt: str, start_after: int = 0) -> int:
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return sum(1 for line_no, _, _ in iter_rows(f, fmt) if line_no > start_after)
+
+def db_records(supabase: Client, filters: Dict[str, Any], before_id: int | None = None,
+               page_size: int = DEFAULT_PAGE_SIZE) -> Iterator[SourceRecord]:
+    """Records matching `filters`, newest first, fetched page by page below `before_id`."""
+    cursor = before_id
+    while True:
+        rows, next_cursor = fetch_page(supabase, limit=page_size, before_id=cursor, columns="*", filters=filters)
+        for row in rows:
+            yield row["id"], str(row["id"]), row_to_pdf_record(row)
+        if next_cursor is None:
+            return
+        cursor = next_cursor
+
+def load_checkpoint(path: str) -> Dict[str, Any] | None:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def save_checkpoint(path: str, state: Dict[str, Any]) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+def _write_file(path: str, data: bytes) -> None:
+    tmp = f"{path}.part"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def _format_progress(done: int, total: int | None, elapsed: float) -> str:
+    rate = done / elapsed if elapsed > 0 else 0.0
+    if not total:
+        return f"Rendered {done} invoices, {rate:.1f}/s"
+    eta = timedelta(seconds=int((total - done) / rate)) if rate else "?"
+    return f"Rendered {done}/{total} invoices ({done / total:.0%}), {rate:.1f}/s, ETA {eta}"
+
+def render_records(
+    records: Iterable[SourceRecord],
+    directory: str,
+    state: Dict[str, Any],
+    checkpoint: str,
+    template_path: str = DEFAULT_TEMPLATE,
+    workers: int | None = None,
+    numbered: bool = False,
+    total: int | None = None,
+    checkpoint_every: int = DEFAULT_CHECKPOINT_EVERY,
+) -> int:
+    """
+    Renders `records` into `directory` as <key>_<name>.pdf (prefixed with a running number
+    when `numbered`, so parts sort in input order). `state` ("position", "written") is
+    updated per file and saved to `checkpoint` every `checkpoint_every` files and on exit,
+    including interrupts. Returns the number of PDFs written by this call.
+    """
+    os.makedirs(directory, exist_ok=True)
+    pending: Deque[Tuple[int, str]] = deque()
+
+    def track(source: Iterable[SourceRecord]) -> Iterator[Dict[str, Any]]:
+        # render_pdfs yields in input order, so each PDF belongs to the oldest pending entry.
+        for position, key, record in source:
+            pending.append((position, f"{key}_{pdf_filename(record.get('name'), 'record')}"))
+            yield record
+
+    done, started, reported = 0, time.perf_counter(), time.perf_counter()
+    try:
+        for pdf in render_pdfs(template_path, track(records), workers=workers):
+            position, filename = pending.popleft()
+            if numbered:
+                filename = f"{state['written']:08d}_{filename}"
+            _write_file(os.path.join(directory, filename), pdf)
+            state["position"], state["written"] = position, state["written"] + 1
+            done += 1
+            if done % checkpoint_every == 0:
+                save_checkpoint(checkpoint, state)
+            now = time.perf_counter()
+            if now - reported >= PROGRESS_SECONDS:
+                print(_format_progress(done, total, now - started))
+                reported = now
+    finally:
+        save_checkpoint(checkpoint, state)
+    print(_format_progress(done, total, time.perf_counter() - started))
+    return done
+
+def assemble(parts_dir: str, output: str) -> None:
+    """Combines the numbered parts into one ZIP (entries named without the number) or merged PDF."""
+    names = sorted(n for n in os.listdir(parts_dir) if n.endswith(".pdf"))
+
+    def read(name: str) -> bytes:
+        with open(os.path.join(parts_dir, name), "rb") as f:
+            return f.read()
+
+    if output.lower().endswith(".zip"):
+        chunks = stream_zip((name.split("_", 1)[1], read(name)) for name in names)
+    else:
+        chunks = stream_merged_pdf(read(name) for name in names)
+    tmp = f"{output}.part"
+    with open(tmp, "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+    os.replace(tmp, output)
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Render invoices to PDF offline from a records file or the database.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input", help="CSV or JSON Lines file of records")
+    source.add_argument("--from-db", action="store_true", help="read records from the database (DB_BACKEND)")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="input format; defaults to the file extension")
+    parser.add_argument("--output", required=True, help="directory for one PDF per record, or a .zip / .pdf file")
+    parser.add_argument("--date-from", help="with --from-db: invoice date on or after")
+    parser.add_argument("--date-to", help="with --from-db: invoice date on or before")
+    parser.add_argument("--name", help="with --from-db: name/address contains")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE, help="with --from-db: records per query")
+    parser.add_argument("--template", default=DEFAULT_TEMPLATE, help="template PDF for layouts that do not name one")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--checkpoint", help="checkpoint file (default: <output>.render_checkpoint)")
+    parser.add_argument("--checkpoint-every", type=int, default=DEFAULT_CHECKPOINT_EVERY)
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    parser.add_argument("--keep-parts", action="store_true", help="keep the per-record parts of a .zip / .pdf output")
+    args = parser.parse_args(argv)
+
+    output = args.output.rstrip("/\\") or args.output
+    archive = output.lower().endswith((".zip", ".pdf"))
+    directory = f"{output}.parts" if archive else output
+    checkpoint = args.checkpoint or f"{output}.render_checkpoint"
+    source_id = os.path.abspath(args.input) if args.input else "db"
+    filters = {k: v for k, v in {"date_from": args.date_from, "date_to": args.date_to, "q": args.name}.items() if v}
+
+    state = None if args.restart else load_checkpoint(checkpoint)
+    if state and (state.get("source") != source_id or state.get("filters") != filters):
+        print(f"❌ {checkpoint} belongs to a different source or filter; pass --restart to start over", file=sys.stderr)
+        return 1
+    if state:
+        print(f"Resuming after {state['written']} rendered invoices (position {state['position']})")
+    else:
+        state = {"source": source_id, "filters": filters, "position": None, "written": 0}
+        if archive:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    if args.input:
+        fmt = args.format or detect_format(args.input)
+        start_after = state["position"] or 0
+        total = count_file_records(args.input, fmt, start_after)
+        records = file_records(args.input, fmt, start_after)
+    else:
+        supabase = client_from_env()
+        total = count_records(supabase, filters) - state["written"]
+        records = db_records(supabase, filters, state["position"], max(args.page_size, 1))
+
+    started = time.perf_counter()
+    try:
+        render_records(
+            records, directory, state, checkpoint, args.template, max(args.workers, 1),
+            numbered=archive, total=total, checkpoint_every=max(args.checkpoint_every, 1),
+        )
+    except KeyboardInterrupt:
+        print(f"Interrupted after {state['written']} invoices; run the same command again to resume", file=sys.stderr)
+        return 130
+    if archive:
+        print(f"Assembling {output}")
+        assemble(directory, output)
+        if not args.keep_parts:
+            shutil.rmtree(directory, ignore_errors=True)
+    os.remove(checkpoint)
+    print(f"✅ {state['written']} invoices in {output} ({time.perf_counter() - started:.1f}s)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
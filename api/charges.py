@@ -0,0 +1,78 @@
+"""
+Exact charge amounts.
+
+Amounts are parsed to integer paise, so sums never pick up float drift. ChargeColumns
+keeps the amounts of many invoices in flat `array` columns for per-invoice totals.
+"""
+from array import array
+from decimal import Context, Decimal, InvalidOperation, ROUND_HALF_UP
+from typing import Any, Dict, Iterable, List
+
+_CENT = Decimal("0.01")
+
+def to_paise(value: Any) -> int:
+    """Parses an amount to integer paise, rounding half up. Unparseable values count as 0, as in to_number."""
+    if isinstance(value, int):
+        return value * 100
+    try:
+        number = value if isinstance(value, float) else float(value)
+        paise = round(number * 100)
+        # Exact whenever the amount has at most two decimals (the float is then the nearest one to paise / 100).
+        if abs(number) < 1e12 and paise / 100 == number:
+            return paise
+    except (TypeError, ValueError, OverflowError):
+        pass
+    return _decimal_paise(value)
+
+def _decimal_paise(value: Any) -> int:
+    text = repr(value) if isinstance(value, float) else str(value if value is not None else "").strip()
+    try:
+        amount = Decimal(text)
+    except InvalidOperation:
+        return 0
+    if not amount.is_finite():
+        return 0
+    try:
+        # The default 28-digit context cannot hold the quantized value of amounts from 1e26 up.
+        context = Context(prec=max(28, amount.adjusted() + 3))
+        return int(amount.quantize(_CENT, rounding=ROUND_HALF_UP, context=context).scaleb(2, context=context))
+    except ArithmeticError:
+        return 0
+
+def format_paise(paise: int) -> str:
+    """Formats paise as a fixed two-decimal amount string, e.g. 123450 -> "1234.50"."""
+    sign = "-" if paise < 0 else ""
+    return f"{sign}{abs(paise) // 100}.{abs(paise) % 100:02d}"
+
+class ChargeColumns:
+    """
+    The charge amounts of many invoices as parallel columns: owning invoice index and
+    amount in paise. Invoice indexes follow the input order.
+    """
+
+    __slots__ = ("invoice", "paise", "invoices")
+
+    def __init__(self):
+        self.invoice = array("q")
+        self.paise = array("q")
+        self.invoices = 0
+
+    @classmethod
+    def from_lists(cls, charge_lists: Iterable[List[Dict[str, Any]]]) -> "ChargeColumns":
+        """Parses one charges list per invoice."""
+        cols = cls()
+        invoice_append, paise_append = cols.invoice.append, cols.paise.append
+        index = -1
+        for index, charges in enumerate(charge_lists):
+            for ch in charges or ():
+                invoice_append(index)
+                paise_append(to_paise(ch.get("amount")))
+        cols.invoices = index + 1
+        return cols
+
+    def totals(self) -> List[int]:
+        """Total paise per invoice."""
+        out = [0] * self.invoices
+        for i, p in zip(self.invoice, self.paise):
+            out[i] += p
+        return out
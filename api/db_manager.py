@@ -1,51 +1,375 @@
-from supabase import Client
-from typing import List, Dict, Any
-from .helpers import to_number
+from __future__ import annotations
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import TYPE_CHECKING, List, Dict, Any, Iterable, Tuple
+from .helpers import to_number, compute_total_from_charges
+from .charges import ChargeColumns, to_paise
+from .layouts import stored_layout
+from .metrics import ERRORS, phase
 
-def insert_record(supabase: Client, data: Dict[str, Any]):
-    """Inserts a new record into the 'pdf_records' table."""
-    payload = {
-        "name": data.get("name"),
-        "date": data.get("date"),
-        "from_date": data.get("from_date"),
-        "to_date": data.get("to_date"),
-        "charges": data.get("charges"),
-        "total": data.get("total"),
-    }
-    return supabase.table("pdf_records").insert(payload).execute()
+if TYPE_CHECKING:
+    from supabase import Client
+
+logger = logging.getLogger(__name__)
+
+# Columns shown on the /records listing.
+LIST_COLUMNS = "id,name,date,from_date,to_date,total"
+
+# Rows still in the legacy schema: no charges array or no stored total.
+NEEDS_MIGRATION_FILTER = "charges.is.null,total.is.null"
+
+# Set once the backfill (python -m api.backfill) has run, so reads can trust `charges`/`total`.
+LEGACY_SCHEMA_MIGRATED = os.environ.get("LEGACY_SCHEMA_MIGRATED") == "1"
+
+# Report groupings and the SQL functions that compute them (see supabase/migrations).
+TOTALS_RPC = {
+    "month": "pdf_records_totals_by_month",
+    "customer": "pdf_records_totals_by_customer",
+    "charge_type": "pdf_records_totals_by_charge_type",
+}
+
+# Request timeout, and how often and how patiently transient failures are retried. _execute is the
+# only retry layer (postgrest's own GET retry on 503/520 is switched off), so a call makes at most
+# DB_MAX_RETRIES + 1 attempts.
+DB_TIMEOUT_SECONDS = float(os.environ.get("DB_TIMEOUT_SECONDS", 10))
+DB_MAX_RETRIES = int(os.environ.get("DB_MAX_RETRIES", 3))
+DB_RETRY_BACKOFF_SECONDS = float(os.environ.get("DB_RETRY_BACKOFF_SECONDS", 0.2))
+
+# PostgREST/Postgres error codes worth retrying: gateway and Cloudflare errors, rate limiting,
+# PostgREST losing its connection pool, serialization failures and server restarts.
+TRANSIENT_ERROR_CODES = {"429", "500", "502", "503", "504", "520", "PGRST000", "PGRST001", "PGRST002", "40001", "40P01", "57P01", "57P03"}
+
+_client = None
+_client_lock = threading.Lock()
 
-def update_record_db(supabase: Client, record_id: int, data: Dict[str, Any]):
-    """Updates an existing record in the 'pdf_records' table."""
-    payload = {
+def client_from_env() -> Client:
+    """
+    Creates a database client for the backend selected by DB_BACKEND: "supabase" (default,
+    from SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY) or "sqlite" (SQLITE_PATH, default in memory).
+    """
+    if os.environ.get("DB_BACKEND", "supabase").lower() == "sqlite":
+        from .sqlite_backend import SqliteClient
+        return SqliteClient(os.environ.get("SQLITE_PATH", ":memory:"))
+    url = os.environ.get("SUPABASE_URL")
+    key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
+    if not url or not key:
+        raise RuntimeError("Missing SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY in environment")
+    import httpx
+    from supabase import create_client, ClientOptions
+    # One pooled keep-alive session for every PostgREST call made through this client.
+    http = httpx.Client(
+        timeout=httpx.Timeout(DB_TIMEOUT_SECONDS, connect=min(DB_TIMEOUT_SECONDS, 5.0)),
+        limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        follow_redirects=True,
+    )
+    return create_client(url, key, ClientOptions(httpx_client=http))
+
+def get_client() -> Client:
+    """Returns the process-wide client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = client_from_env()
+    return _client
+
+def _is_transient(exc: Exception, idempotent: bool) -> bool:
+    import httpx
+    if isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+        return True  # the request never reached the server
+    if isinstance(exc, sqlite3.OperationalError):
+        return "locked" in str(exc) or "busy" in str(exc)
+    if not idempotent:
+        return False
+    if isinstance(exc, httpx.TransportError):
+        return True
+    return str(getattr(exc, "code", "")) in TRANSIENT_ERROR_CODES
+
+def _execute(query, idempotent: bool = True):
+    """
+    Runs a query builder's execute(), retrying transient failures with exponential backoff and jitter.
+    Non-idempotent writes (inserts) are only retried when the request cannot have reached the server.
+    """
+    if hasattr(query, "retry"):
+        query = query.retry(False)  # postgrest >= 2.x would otherwise retry GETs itself, on top of this loop
+    for attempt in range(DB_MAX_RETRIES + 1):
+        try:
+            with phase("db"):
+                return query.execute()
+        except Exception as e:
+            if attempt == DB_MAX_RETRIES or not _is_transient(e, idempotent):
+                raise
+            ERRORS.inc(operation="db_retry", error=type(e).__name__)
+            delay = min(DB_RETRY_BACKOFF_SECONDS * 2 ** attempt, 5.0)
+            logger.warning("Database call failed (%s); retrying in %.2fs", e, delay)
+            time.sleep(random.uniform(delay / 2, delay))
+
+def _record_payload(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {
         "name": data.get("name"),
         "date": data.get("date"),
         "from_date": data.get("from_date"),
         "to_date": data.get("to_date"),
         "charges": data.get("charges"),
         "total": data.get("total"),
+        "layout": data.get("layout") or None,
     }
-    return supabase.table("pdf_records").update(payload).eq("id", record_id).execute()
+
+def insert_record(supabase: Client, data: Dict[str, Any]):
+    """Inserts a new record into the 'pdf_records' table."""
+    return _execute(supabase.table("pdf_records").insert(_record_payload(data)), idempotent=False)
+
+def upsert_record(supabase: Client, data: Dict[str, Any], idempotency_key: str):
+    """Inserts a record under an idempotency key. Repeating the call with the same key keeps the existing row."""
+    payload = {**_record_payload(data), "idempotency_key": idempotency_key}
+    return _execute(supabase.table("pdf_records").upsert(payload, on_conflict="idempotency_key", ignore_duplicates=True))
+
+def upsert_records(supabase: Client, keyed_records: List[Tuple[str, Dict[str, Any]]]):
+    """Inserts (idempotency key, record) pairs in a single request, keeping rows whose key already exists."""
+    payload = [{**_record_payload(r), "idempotency_key": key} for key, r in keyed_records]
+    return _execute(supabase.table("pdf_records").upsert(payload, on_conflict="idempotency_key", ignore_duplicates=True))
+
+def is_rejection(exc: Exception) -> bool:
+    """
+    True when the database definitely refused a request (a PostgREST error response or an
+    SQLite constraint/data error), as opposed to a transport failure or gateway error after
+    which the write may or may not have been applied.
+    """
+    if isinstance(exc, sqlite3.Error):
+        return not isinstance(exc, sqlite3.OperationalError)
+    try:
+        from postgrest.exceptions import APIError
+    except ImportError:
+        return False
+    return isinstance(exc, APIError) and str(exc.code or "") not in TRANSIENT_ERROR_CODES
+
+class StaleRecordError(Exception):
+    """Raised when a record changed after the editor loaded it."""
+
+def _changed_fields(current: Dict[str, Any], data: Dict[str, Any]) -> Dict[str, Any]:
+    changed = {}
+    for field in ("name", "date", "from_date", "to_date", "layout"):
+        if str(current.get(field) or "") != str(data.get(field) or ""):
+            changed[field] = data.get(field)
+    if current.get("total") is None or round(to_number(current["total"]), 2) != round(to_number(data.get("total")), 2):
+        changed["total"] = data.get("total")
+    return changed
+
+def charges_patch(stored: Any, charges: List[Dict[str, Any]]) -> Dict[str, Any] | None:
+    """
+    Describes `charges` as the changed entries of the stored array: {"length": n, "set": {"index": entry}}.
+    Returns None when the stored value is not an array or the patch would not be smaller than the array.
+    """
+    if not isinstance(stored, list):
+        return None
+    changed = {str(i): ch for i, ch in enumerate(charges) if i >= len(stored) or stored[i] != ch}
+    if len(changed) * 2 > len(charges):
+        return None
+    return {"length": len(charges), "set": changed}
+
+def update_record_db(supabase: Client, record_id: int, data: Dict[str, Any], expected_version: int | None = None) -> Dict[str, Any]:
+    """
+    Applies an edit by sending only what changed: the changed columns and, for the charges
+    array, just the changed entries. The write is rejected with StaleRecordError if the
+    record is no longer at `expected_version` (or the version read here, when not given).
+    Returns the changed fields; an edit that changes nothing writes nothing.
+    """
+    current = fetch_one(supabase, record_id)
+    if not current:
+        raise LookupError(f"Record {record_id} not found")
+    version = current.get("version") or 1
+    if expected_version is not None and expected_version != version:
+        raise StaleRecordError(f"Record {record_id} is at version {version}, not {expected_version}")
+
+    fields = _changed_fields(current, data)
+    params: Dict[str, Any] = {"p_id": record_id, "p_version": version, "p_fields": fields}
+    changed = dict(fields)
+    charges = data.get("charges") or []
+    if current.get("charges") != charges:
+        changed["charges"] = charges
+        patch = charges_patch(current.get("charges"), charges)
+        if patch is None:
+            fields["charges"] = charges
+        else:
+            params.update(p_charges_length=patch["length"], p_charges_set=patch["set"])
+    if not changed:
+        return {}
+    # Not retried on ambiguous failures: a lost response to a successful patch would look stale.
+    res = _execute(supabase.rpc("pdf_records_patch", params), idempotent=False)
+    if res.data is None:
+        raise StaleRecordError(f"Record {record_id} was changed by someone else")
+    return changed
 
 def fetch_one(supabase: Client, record_id: int) -> Dict[str, Any] | None:
     """Fetches a single record by its ID."""
-    res = supabase.table("pdf_records").select("*").eq("id", record_id).single().execute()
-    return res.data if res.data else None
+    # Not .single(): PostgREST answers that with an error (PGRST116) when the row does not exist.
+    res = _execute(supabase.table("pdf_records").select("*").eq("id", record_id).limit(1))
+    return res.data[0] if res.data else None
 
 def fetch_all(supabase: Client) -> List[Dict[str, Any]]:
     """Fetches all records, ordered by ID descending."""
-    res = supabase.table("pdf_records").select("*").order("id", desc=True).execute()
+    res = _execute(supabase.table("pdf_records").select("*").order("id", desc=True))
+    return res.data or []
+
+# Search filter keys understood by apply_search and the pdf_records_grand_total RPC.
+SEARCH_FILTERS = ("q", "date_from", "date_to", "period_from", "period_to", "total_min", "total_max", "charge_type")
+
+def apply_search(query, filters: Dict[str, Any] | None):
+    """
+    Adds the /records search filters to a query so they run in the database (see the
+    search indexes migration). Recognised keys, all optional: q (name/address text),
+    date_from/date_to (invoice date), period_from/period_to (billing periods overlapping
+    the range), total_min/total_max and charge_type.
+    """
+    filters = {k: v for k, v in (filters or {}).items() if v not in (None, "")}
+    if "q" in filters:
+        query = query.ilike("name", f"%{filters['q']}%")
+    if "date_from" in filters:
+        query = query.gte("date", filters["date_from"])
+    if "date_to" in filters:
+        query = query.lte("date", filters["date_to"])
+    if "period_from" in filters:
+        query = query.gte("to_date", filters["period_from"])
+    if "period_to" in filters:
+        query = query.lte("from_date", filters["period_to"])
+    if "total_min" in filters:
+        query = query.gte("total", filters["total_min"])
+    if "total_max" in filters:
+        query = query.lte("total", filters["total_max"])
+    if "charge_type" in filters:
+        query = query.contains("charge_types", [str(filters["charge_type"]).strip().upper()])
+    return query
+
+def fetch_page(
+    supabase: Client,
+    limit: int = 50,
+    before_id: int | None = None,
+    columns: str = LIST_COLUMNS,
+    filters: Dict[str, Any] | None = None,
+) -> Tuple[List[Dict[str, Any]], int | None]:
+    """
+    Fetches one page of records ordered by ID descending using keyset pagination,
+    optionally narrowed by search `filters` (see apply_search).
+    Returns the rows and the cursor for the next page (None on the last page).
+    """
+    query = apply_search(supabase.table("pdf_records").select(columns), filters).order("id", desc=True)
+    if before_id is not None:
+        query = query.lt("id", before_id)
+    rows = _execute(query.limit(limit + 1)).data or []
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, rows[-1]["id"]
+    return rows, None
+
+def count_records(supabase: Client, filters: Dict[str, Any] | None = None) -> int:
+    """Counts the records matching search `filters` (see apply_search)."""
+    res = _execute(apply_search(supabase.table("pdf_records").select("id", count="exact"), filters).limit(1))
+    return res.count or 0
+
+def fill_missing_totals(supabase: Client, rows: List[Dict[str, Any]]) -> None:
+    """Computes `total` in place for legacy rows that have none stored."""
+    missing = [r["id"] for r in rows if r.get("total") is None]
+    if not missing:
+        return
+    fetched = fetch_many(supabase, ids=missing)
+    totals = {r["id"]: paise / 100 for r, paise in zip(fetched, charge_columns(fetched).totals())}
+    for r in rows:
+        if r.get("total") is None:
+            r["total"] = totals.get(r["id"], 0.0)
+
+def fetch_grand_total(supabase: Client, filters: Dict[str, Any] | None = None) -> float:
+    """
+    Sums the totals of the records matching search `filters` (see apply_search; all records
+    when empty) with a database aggregate, legacy rows without a stored total included.
+    """
+    params = {f"p_{k}": v for k, v in (filters or {}).items() if k in SEARCH_FILTERS and v not in (None, "")}
+    res = _execute(supabase.rpc("pdf_records_grand_total", params))
+    return to_paise(res.data or 0) / 100
+
+def fetch_totals(
+    supabase: Client,
+    group_by: str,
+    date_from: str | None = None,
+    date_to: str | None = None,
+) -> List[Dict[str, Any]]:
+    """Returns invoice count and total per month, customer or charge type, aggregated in the database."""
+    if group_by not in TOTALS_RPC:
+        raise ValueError(f"Unsupported grouping '{group_by}'")
+    res = _execute(supabase.rpc(TOTALS_RPC[group_by], {"p_from": date_from or None, "p_to": date_to or None}))
+    return [
+        {"bucket": r["bucket"], "invoices": r["invoices"], "total": to_paise(r["total"] or 0) / 100}
+        for r in res.data or []
+    ]
+
+def fetch_many(
+    supabase: Client,
+    ids: Iterable[int] | None = None,
+    date_from: str | None = None,
+    date_to: str | None = None,
+    name: str | None = None,
+    limit: int | None = None,
+) -> List[Dict[str, Any]]:
+    """Fetches the records matching an id list, an invoice date range and/or a name filter in one query."""
+    query = supabase.table("pdf_records").select("*")
+    if ids:
+        query = query.in_("id", list(ids))
+    if date_from:
+        query = query.gte("date", date_from)
+    if date_to:
+        query = query.lte("date", date_to)
+    if name:
+        query = query.ilike("name", f"%{name}%")
+    query = query.order("id")
+    if limit:
+        query = query.limit(limit)
+    res = _execute(query)
+    return res.data or []
+
+def fetch_rows_needing_migration(supabase: Client, after_id: int = 0, limit: int = 500) -> List[Dict[str, Any]]:
+    """Fetches the next chunk (by ascending ID) of rows with no charges array or no stored total."""
+    res = _execute(
+        supabase.table("pdf_records").select("*")
+        .or_(NEEDS_MIGRATION_FILTER).gt("id", after_id)
+        .order("id").limit(limit)
+    )
     return res.data or []
 
+def count_rows_needing_migration(supabase: Client) -> int:
+    """Counts rows that still need the legacy-to-charges migration."""
+    res = _execute(supabase.table("pdf_records").select("id", count="exact").or_(NEEDS_MIGRATION_FILTER).limit(1))
+    return res.count or 0
+
+def store_charges_and_total(supabase: Client, record_id: int, version: int, charges: List[Dict[str, Any]], total: float) -> bool:
+    """
+    Persists the migrated charges array and total for one record and bumps its version, but only
+    while the record is still at `version`. Returns False when it was edited (or deleted) meanwhile.
+    """
+    res = _execute(
+        supabase.table("pdf_records")
+        .update({"charges": charges, "total": total, "version": version + 1})
+        .eq("id", record_id).eq("version", version)
+    )
+    return bool(res.data)
+
 def delete_record_db(supabase: Client, record_id: int):
     """Deletes a record from the 'pdf_records' table."""
-    return supabase.table("pdf_records").delete().eq("id", record_id).execute()
+    return _execute(supabase.table("pdf_records").delete().eq("id", record_id))
 
 def migrate_row_to_charges_if_needed(row: Dict[str, Any]) -> List[Dict[str, Any]]:
     """
     Backward compatibility helper. Converts old schema rows to the new charges array format.
+    Once LEGACY_SCHEMA_MIGRATED is set the stored charges array is returned as-is.
     """
-    if row.get("charges"):
-        return row["charges"]
+    if row.get("charges") or LEGACY_SCHEMA_MIGRATED:
+        return row.get("charges") or []
+    return convert_legacy_charges(row)
+
+def convert_legacy_charges(row: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Builds a charges array from the legacy per-charge amount/remark columns."""
     pairs = [
         ("C & F CHARGES", "cf_charges", "cf_remarks"),
         ("GODOWN RENT", "godown_rent", "godown_remarks"),
@@ -62,4 +386,21 @@ def migrate_row_to_charges_if_needed(row: Dict[str, Any]) -> List[Dict[str, Any]
         remark = row.get(remark_key)
         if amount is not None and str(amount).strip() not in ("", "None", "null"):
             charges.append({"type": label, "amount": to_number(amount), "remark": remark or ""})
-    return charges
\ No newline at end of file
+    return charges
+
+def charge_columns(rows: Iterable[Dict[str, Any]]) -> ChargeColumns:
+    """Columnar, exact-paise view of the charges of many rows (legacy rows converted) for bulk totals."""
+    return ChargeColumns.from_lists(migrate_row_to_charges_if_needed(r) for r in rows)
+
+def row_to_pdf_record(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Builds the data dict expected by the PDF generator from a database row."""
+    charges = migrate_row_to_charges_if_needed(row)
+    return {
+        "name": row.get("name", ""),
+        "date": row.get("date", ""),
+        "from_date": row.get("from_date", ""),
+        "to_date": row.get("to_date", ""),
+        "charges": charges,
+        "total": row.get("total") or compute_total_from_charges(charges),
+        "layout": stored_layout(row.get("layout")),
+    }
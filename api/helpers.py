@@ -1,5 +1,8 @@
+import hashlib
+import json
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable
+from .charges import to_paise
 
 def format_date_ddmmyyyy(date_str: str) -> str:
     """Formats a YYYY-MM-DD date string to DD-MM-YYYY."""
@@ -17,22 +20,37 @@ def to_number(val: Any) -> float:
         return 0.0
 
 def compute_total_from_charges(charges: List[Dict[str, Any]]) -> float:
-    """Calculates the total amount from a list of charge dictionaries."""
-    return round(sum(to_number(ch.get("amount", 0)) for ch in (charges or [])), 2)
+    """Calculates the total amount from a list of charge dictionaries, summing exact paise."""
+    return sum(to_paise(ch.get("amount", 0)) for ch in (charges or [])) / 100
 
 def normalize_charges_from_request(form) -> List[Dict[str, Any]]:
     """
     Parses Flask request form data for charges and returns a list of dictionaries.
     Filters out empty rows.
     """
-    types = form.getlist("charge_type[]")
-    amounts = form.getlist("charge_amount[]")
-    remarks = form.getlist("charge_remark[]")
+    return normalize_charges(form.getlist("charge_type[]"), form.getlist("charge_amount[]"), form.getlist("charge_remark[]"))
+
+def normalize_charges(types: Iterable[Any], amounts: Iterable[Any], remarks: Iterable[Any]) -> List[Dict[str, Any]]:
+    """Zips parallel type/amount/remark columns into charge dictionaries, skipping empty rows."""
     charges = []
     for t, a, r in zip(types, amounts, remarks):
-        t = (t or "").strip()
-        if not t and not (a or "").strip() and not (r or "").strip():
+        t = str(t or "").strip()
+        if not t and not str(a if a is not None else "").strip() and not str(r or "").strip():
             continue
         amt = to_number(a)
-        charges.append({"type": t, "amount": amt, "remark": r or ""})
-    return charges
\ No newline at end of file
+        charges.append({"type": t, "amount": amt, "remark": str(r or "")})
+    return charges
+
+def pdf_filename(name: Any, fallback: str = "document") -> str:
+    """Builds a download filename from the first line of the name/address field."""
+    user_name = str(name or "").split("\n")[0].strip().replace(" ", "_")
+    return f"{user_name or fallback}.pdf"
+
+def idempotency_key(record: Dict[str, Any], client_key: str = "") -> str:
+    """
+    Key identifying one submission of an invoice: the form's per-page key plus the record
+    content, so a resubmitted form maps to the same row while an edited one gets a new row.
+    Without a client key the record content alone is used.
+    """
+    payload = json.dumps(record, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(f"{client_key}\0{payload}".encode()).hexdigest()
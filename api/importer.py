@@ -0,0 +1,193 @@
+"""
+Bulk import of invoices from CSV or JSON Lines.
+
+    python -m api.importer invoices.csv --batch-size 500
+
+Each row needs name, date, from_date and to_date, plus either a `charges` JSON array
+or the legacy per-charge columns (cf_charges, godown_rent, ...), and may name a `layout`
+(layouts/<name>.json; empty for the default). Rows are validated and normalized like
+the form, inserted in batches, and any rejected row is reported with its line number.
+Interrupted imports resume from the checkpoint file; rows carry an idempotency key
+(line number plus content), so a batch that is sent twice is only stored once.
+"""
+from __future__ import annotations
+import argparse
+import csv
+import json
+import os
+import sys
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Dict, IO, Iterable, Iterator, List, Tuple
+from .db_manager import client_from_env, upsert_records, upsert_record, is_rejection, convert_legacy_charges
+from .helpers import normalize_charges, compute_total_from_charges, idempotency_key
+from .layouts import load_layout
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+DEFAULT_BATCH_SIZE = 500
+DATE_FIELDS = ("date", "from_date", "to_date")
+
+def iter_rows(stream: IO[str], fmt: str) -> Iterator[Tuple[int, Dict[str, Any] | None, str | None]]:
+    """Yields (line number, raw row, parse error) from a CSV or JSON Lines text stream."""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row, None
+        return
+    for line_no, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_no, None, f"invalid JSON: {e.msg}"
+            continue
+        if not isinstance(row, dict):
+            yield line_no, None, "expected a JSON object"
+            continue
+        yield line_no, row, None
+
+def detect_format(filename: str) -> str:
+    """Picks the input format from the file extension (.csv, otherwise JSON Lines)."""
+    return "csv" if filename.lower().endswith(".csv") else "jsonl"
+
+def _normalize_date(value: Any, field: str) -> str:
+    text = str(value or "").strip()
+    for fmt in ("%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(text, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    raise ValueError(f"{field}: expected YYYY-MM-DD, got {text!r}")
+
+def normalize_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Validates one imported row and converts it to the shape the form produces. Raises ValueError."""
+    name = str(row.get("name") or "").replace("\\n", "\n").strip()
+    if not name:
+        raise ValueError("name is required")
+    record: Dict[str, Any] = {"name": name}
+    for field in DATE_FIELDS:
+        record[field] = _normalize_date(row.get(field), field)
+    if record["to_date"] < record["from_date"]:
+        raise ValueError("to_date cannot be earlier than from_date")
+
+    charges = row.get("charges")
+    if isinstance(charges, str) and charges.strip():
+        try:
+            charges = json.loads(charges)
+        except json.JSONDecodeError:
+            raise ValueError("charges is not valid JSON") from None
+    if charges:
+        if not isinstance(charges, list) or not all(isinstance(ch, dict) for ch in charges):
+            raise ValueError("charges must be a list of objects")
+    else:
+        charges = convert_legacy_charges(row)
+    record["charges"] = normalize_charges(
+        [ch.get("type") for ch in charges],
+        [ch.get("amount") for ch in charges],
+        [ch.get("remark") for ch in charges],
+    )
+    record["total"] = compute_total_from_charges(record["charges"])
+    record["layout"] = str(row.get("layout") or "").strip() or None
+    if record["layout"]:
+        load_layout(record["layout"])
+    given = row.get("total")
+    if given not in (None, "") and abs(float(given) - record["total"]) > 0.005:
+        raise ValueError(f"total {given} does not match sum of charges {record['total']:.2f}")
+    return record
+
+def _flush(supabase: Client, batch: List[Tuple[int, Dict[str, Any]]], errors: List[Dict[str, Any]]) -> int:
+    """
+    Upserts a batch under per-row idempotency keys (line number plus content), so a batch
+    that is sent again - after a lost response or a resumed import - adds no duplicates.
+    If the database rejects the batch, rows are retried one by one to pin down the failing
+    rows; transport failures propagate, leaving the checkpoint before this batch.
+    Returns the number of rows added (rows already imported are not counted).
+    """
+    keyed = [(line_no, idempotency_key(rec, f"import:{line_no}"), rec) for line_no, rec in batch]
+    try:
+        return len(upsert_records(supabase, [(key, rec) for _, key, rec in keyed]).data or [])
+    except Exception as e:
+        if not is_rejection(e):
+            raise
+    inserted = 0
+    for line_no, key, rec in keyed:
+        try:
+            inserted += len(upsert_record(supabase, rec, key).data or [])
+        except Exception as e:
+            if not is_rejection(e):
+                raise
+            errors.append({"line": line_no, "error": f"insert failed: {e}"})
+    return inserted
+
+def import_rows(
+    supabase: Client,
+    rows: Iterable[Tuple[int, Dict[str, Any] | None, str | None]],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    start_after_line: int = 0,
+    on_batch=None,
+) -> Dict[str, Any]:
+    """
+    Validates and inserts rows in batches. Lines up to `start_after_line` are skipped,
+    and `on_batch(last_line)` is called after each committed batch so callers can checkpoint.
+    """
+    report: Dict[str, Any] = {"inserted": 0, "skipped": 0, "errors": [], "last_line": start_after_line}
+    batch: List[Tuple[int, Dict[str, Any]]] = []
+
+    def flush(last_line: int) -> None:
+        if batch:
+            report["inserted"] += _flush(supabase, batch, report["errors"])
+            batch.clear()
+        report["last_line"] = last_line
+        if on_batch:
+            on_batch(last_line)
+
+    line_no = start_after_line
+    for line_no, row, error in rows:
+        if line_no <= start_after_line:
+            report["skipped"] += 1
+            continue
+        if error is None:
+            try:
+                batch.append((line_no, normalize_row(row)))
+            except (ValueError, TypeError) as e:
+                error = str(e)
+        if error is not None:
+            report["errors"].append({"line": line_no, "error": error})
+        if len(batch) >= batch_size:
+            flush(line_no)
+    flush(max(line_no, report["last_line"]))
+    return report
+
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Import invoices from a CSV or JSON Lines file.")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="defaults to the file extension")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--checkpoint", help="checkpoint file (default: <path>.import_checkpoint)")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    args = parser.parse_args(argv)
+
+    checkpoint = args.checkpoint or f"{args.path}.import_checkpoint"
+    start_after = 0
+    if not args.restart and os.path.exists(checkpoint):
+        with open(checkpoint) as f:
+            start_after = int(f.read().strip() or 0)
+        print(f"Resuming after line {start_after}")
+
+    def save(last_line: int) -> None:
+        with open(checkpoint, "w") as f:
+            f.write(str(last_line))
+        print(f"Committed through line {last_line}")
+
+    supabase = client_from_env()
+    with open(args.path, newline="", encoding="utf-8-sig") as f:
+        rows = iter_rows(f, args.format or detect_format(args.path))
+        report = import_rows(supabase, rows, args.batch_size, start_after, on_batch=save)
+    for err in report["errors"]:
+        print(f"❌ line {err['line']}: {err['error']}", file=sys.stderr)
+    print(f"✅ Inserted {report['inserted']} rows, {len(report['errors'])} errors")
+
+if __name__ == "__main__":
+    main()
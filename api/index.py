@@ -1,30 +1,110 @@
+import contextvars
+import cProfile
+import io
 import os
-from flask import Flask, render_template_string, request, send_file, redirect, url_for
-from supabase import create_client, Client
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from datetime import datetime
+from flask import Flask, Response, g, jsonify, render_template, request, send_file, redirect, url_for
 from .db_manager import (
-    insert_record,
+    get_client,
+    upsert_record,
     update_record_db,
+    StaleRecordError,
     fetch_one,
-    fetch_all,
+    fetch_page,
+    fetch_many,
+    fill_missing_totals,
+    fetch_grand_total,
+    fetch_totals,
     delete_record_db,
     migrate_row_to_charges_if_needed,
+    row_to_pdf_record,
+    is_rejection,
+    SEARCH_FILTERS,
 )
-from .pdf_generator import fill_pdf_with_overlay
+from .pdf_cache import cache_from_env, pdf_cache_key
+from .importer import iter_rows, import_rows, detect_format, DEFAULT_BATCH_SIZE
+from .jobs import JobQueue
+from .outbox import Outbox
+from .metrics import (
+    REQUEST_SECONDS,
+    RESPONSE_BYTES,
+    count_bytes,
+    profile_requested,
+    record_error,
+    render_gauge,
+    render_metrics,
+    request_phases,
+    save_profile,
+    start_request,
+)
+from .charges import to_paise
+from .layouts import DEFAULT_LAYOUT, layout_names, load_layout
 from .helpers import (
     normalize_charges_from_request,
     compute_total_from_charges,
+    pdf_filename,
+    idempotency_key,
 )
 
 # ----------------------------- Configuration & Initialization ----------------------------- #
 app = Flask(__name__)
 
-SUPABASE_URL = os.environ.get("SUPABASE_URL")
-SUPABASE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise RuntimeError("Missing SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY in environment")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-
 TEMPLATE_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "template.pdf"))
+pdf_cache = cache_from_env()
+EXPORT_MAX_RECORDS = int(os.environ.get("EXPORT_MAX_RECORDS", 500))
+RECORDS_PAGE_SIZE, RECORDS_MAX_PAGE_SIZE = 50, 200
+JOB_MAX_RECORDS = int(os.environ.get("JOB_MAX_RECORDS", 10000))
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+# How long /generate waits, after rendering, for its database write before answering
+# with the record still queued in the outbox.
+GENERATE_SAVE_WAIT_SECONDS = float(os.environ.get("GENERATE_SAVE_WAIT_SECONDS", 5))
+
+def _load_job_rows(selection):
+    rows = fetch_many(get_client(), limit=JOB_MAX_RECORDS + 1, **{k: selection.get(k) for k in ("ids", "date_from", "date_to", "name")})
+    if len(rows) > JOB_MAX_RECORDS:
+        raise ValueError(f"Too many records (max {JOB_MAX_RECORDS}); narrow the filter")
+    return rows
+
+persist_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="persist")
+
+# Created on first use rather than at import, so cold starts skip their disk and SQLite setup.
+_outbox: Outbox | None = None
+_job_queue: JobQueue | None = None
+_lazy_lock = threading.Lock()
+
+def get_outbox() -> Outbox:
+    """Returns the process-wide outbox, creating it on first use."""
+    global _outbox
+    if _outbox is None:
+        with _lazy_lock:
+            if _outbox is None:
+                # The default under /tmp is only durable while this instance lives: a recycled
+                # serverless instance loses it, so point OUTBOX_PATH at persistent storage where
+                # that matters.
+                _outbox = Outbox(
+                    os.environ.get("OUTBOX_PATH") or os.path.join(tempfile.gettempdir(), "invoiceforge-outbox.sqlite3"),
+                    lambda key, record: upsert_record(get_client(), record, key),
+                    retry_seconds=float(os.environ.get("OUTBOX_RETRY_SECONDS", 30)),
+                    is_rejection=is_rejection,
+                )
+    return _outbox
+
+def get_job_queue() -> JobQueue:
+    """Returns the process-wide job queue, creating it on first use."""
+    global _job_queue
+    if _job_queue is None:
+        with _lazy_lock:
+            if _job_queue is None:
+                _job_queue = JobQueue(
+                    os.environ.get("JOBS_DIR") or os.path.join(tempfile.gettempdir(), "invoiceforge-jobs"),
+                    TEMPLATE_PATH, _load_job_rows, workers=int(os.environ.get("JOB_WORKERS", 2)),
+                )
+    return _job_queue
 
 # HTML Templates (kept here for simplicity)
 BASE_HEAD = """
@@ -50,6 +130,8 @@ HTML_FORM = BASE_HEAD + """
       </div>
     </div>
     <form method="post" action="{{ action_url }}" class="space-y-6" id="bill-form">
+      {% if is_create %}<input type="hidden" name="idempotency_key" value="{{ form_key }}">{% endif %}
+      {% if version %}<input type="hidden" name="version" value="{{ version }}">{% endif %}
       <div class="grid grid-cols-1 md:grid-cols-2 gap-6">
         <div>
           <label class="block text-gray-300 font-medium mb-1">Name & Address</label>
@@ -70,6 +152,19 @@ HTML_FORM = BASE_HEAD + """
               <input type="date" id="to_date" name="to_date" value="{{ data.get('to_date','') }}" class="w-full border border-gray-600 rounded-lg p-3 focus:ring-2 focus:ring-green-400 bg-gray-700 text-white" required>
             </div>
           </div>
+          {% if layouts|length > 1 %}
+          <div>
+            <label class="block text-gray-300 font-medium mb-1">Layout</label>
+            <select name="layout" class="w-full border border-gray-600 rounded-lg p-3 focus:ring-2 focus:ring-green-400 bg-gray-700 text-white">
+              <option value="">Default ({{ default_layout }})</option>
+              {% for name in layouts %}
+              <option value="{{ name }}" {% if data.get('layout') == name %}selected{% endif %}>{{ name }}</option>
+              {% endfor %}
+            </select>
+          </div>
+          {% else %}
+          <input type="hidden" name="layout" value="{{ data.get('layout') or '' }}">
+          {% endif %}
         </div>
       </div>
       <div class="overflow-x-auto">
@@ -175,6 +270,21 @@ HTML_RECORDS = BASE_HEAD + """
       <h1 class="text-3xl font-bold text-green-400">📊 Database Records</h1>
       <a href="{{ url_for('form') }}" class="px-4 py-2 bg-slate-600 rounded-lg hover:bg-slate-700">+ New</a>
     </div>
+    <form method="get" action="{{ url_for('records') }}" class="bg-gray-800 rounded-2xl shadow-lg p-4 mb-4 grid grid-cols-2 md:grid-cols-4 gap-3 text-sm">
+      <input type="hidden" name="page_size" value="{{ page_size }}">
+      <input type="text" name="q" value="{{ search.get('q','') }}" placeholder="Customer name or address" class="md:col-span-2 border border-gray-600 rounded p-2 bg-gray-700 text-white">
+      <input type="text" name="charge_type" value="{{ search.get('charge_type','') }}" placeholder="Charge type, e.g. GODOWN RENT" class="md:col-span-2 border border-gray-600 rounded p-2 bg-gray-700 text-white">
+      <label class="flex flex-col gap-1 text-gray-400">Date from<input type="date" name="date_from" value="{{ search.get('date_from','') }}" class="border border-gray-600 rounded p-2 bg-gray-700 text-white"></label>
+      <label class="flex flex-col gap-1 text-gray-400">Date to<input type="date" name="date_to" value="{{ search.get('date_to','') }}" class="border border-gray-600 rounded p-2 bg-gray-700 text-white"></label>
+      <label class="flex flex-col gap-1 text-gray-400">Period from<input type="date" name="period_from" value="{{ search.get('period_from','') }}" class="border border-gray-600 rounded p-2 bg-gray-700 text-white"></label>
+      <label class="flex flex-col gap-1 text-gray-400">Period to<input type="date" name="period_to" value="{{ search.get('period_to','') }}" class="border border-gray-600 rounded p-2 bg-gray-700 text-white"></label>
+      <input type="number" step="0.01" name="total_min" value="{{ search.get('total_min','') }}" placeholder="Min total" class="border border-gray-600 rounded p-2 bg-gray-700 text-white text-right">
+      <input type="number" step="0.01" name="total_max" value="{{ search.get('total_max','') }}" placeholder="Max total" class="border border-gray-600 rounded p-2 bg-gray-700 text-white text-right">
+      <button type="submit" class="px-4 py-2 bg-green-600 rounded hover:bg-green-700">🔍 Search</button>
+      {% if search %}
+      <a href="{{ url_for('records', page_size=page_size) }}" class="px-4 py-2 bg-slate-600 rounded hover:bg-slate-700 text-center">Clear</a>
+      {% endif %}
+    </form>
     <div class="bg-gray-800 rounded-2xl shadow-lg p-4 overflow-x-auto">
       <table class="w-full border border-gray-700 rounded-lg overflow-hidden text-sm">
         <thead class="bg-gray-700">
@@ -210,14 +320,24 @@ HTML_RECORDS = BASE_HEAD + """
           {% endfor %}
           {% if not rows %}
           <tr>
-            <td colspan="7" class="px-3 py-6 text-center text-gray-400">No records yet.</td>
+            <td colspan="7" class="px-3 py-6 text-center text-gray-400">{{ 'No matching records.' if search else 'No records yet.' }}</td>
           </tr>
           {% endif %}
         </tbody>
       </table>
     </div>
-    <div class="mt-4 text-right text-xl font-semibold text-green-400">
-      Grand Total: {{ "%.2f"|format(grand_total) }}
+    <div class="mt-4 flex items-center justify-between">
+      <div class="flex gap-2">
+        {% if cursor %}
+        <a href="{{ url_for('records', page_size=page_size, **search) }}" class="px-3 py-1 bg-slate-600 rounded hover:bg-slate-700">⏮ Newest</a>
+        {% endif %}
+        {% if next_cursor %}
+        <a href="{{ url_for('records', page_size=page_size, cursor=next_cursor, **search) }}" class="px-3 py-1 bg-slate-600 rounded hover:bg-slate-700">Older ➡</a>
+        {% endif %}
+      </div>
+      <div class="text-xl font-semibold text-green-400">
+        {{ "Total of matching records" if search else "Grand Total" }}: {{ "%.2f"|format(grand_total) }}
+      </div>
     </div>
     <div class="mt-6">
       <a href="{{ url_for('form') }}" class="px-4 py-2 bg-green-600 rounded-lg hover:bg-green-700">⬅ Back to Form</a>
@@ -227,74 +347,290 @@ HTML_RECORDS = BASE_HEAD + """
 </html>
 """
 
+# Compiled once per process rather than on every render_template_string call.
+FORM_TEMPLATE = app.jinja_env.from_string(HTML_FORM)
+RECORDS_TEMPLATE = app.jinja_env.from_string(HTML_RECORDS)
+
+# ----------------------------- Instrumentation ----------------------------- #
+
+@app.before_request
+def start_timing():
+    g.request_start = time.perf_counter()
+    start_request()
+    if profile_requested(request.headers.get("X-Profile")):
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+@app.after_request
+def record_timing(response):
+    """Observes latency and size per route and reports the phase split in a Server-Timing header."""
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.disable()
+        response.headers["X-Profile-Id"] = save_profile(profiler, f"{request.method} {route}")
+    elapsed = time.perf_counter() - g.pop("request_start", time.perf_counter())
+    REQUEST_SECONDS.observe(elapsed, route=route, method=request.method, status=str(response.status_code))
+    if response.content_length is not None:
+        RESPONSE_BYTES.observe(response.content_length, route=route)
+    elif response.is_streamed:
+        response.response = count_bytes(response.response, route)
+    timings = {**request_phases(), "total": elapsed}
+    response.headers["Server-Timing"] = ", ".join(f"{name};dur={sec * 1000:.1f}" for name, sec in timings.items())
+    return response
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus scrape endpoint. Requires `Authorization: Bearer $METRICS_TOKEN` when that is set."""
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        return "Unauthorized", 401
+    body = render_metrics()
+    if _outbox is not None:  # not created just for a scrape
+        counts = _outbox.counts()
+        body += render_gauge(
+            "invoiceforge_outbox_entries", "Records in the local outbox by status (rejected ones need attention).",
+            [({"status": status}, counts.get(status, 0)) for status in ("pending", "rejected")],
+        )
+    return Response(body, mimetype="text/plain; version=0.0.4")
+
 # ----------------------------- Routes ----------------------------- #
 
+def _form_layout() -> str | None:
+    """The layout chosen on the form, or None for the default. Raises ValueError for unknown layouts."""
+    name = request.form.get("layout", "").strip() or None
+    if name:
+        load_layout(name)
+    return name
+
 @app.route("/", methods=["GET"])
 def form():
     context = {
         "title": "PDF Generator", "header": "📄 PDF Generator",
         "action_url": url_for("generate"), "submit_label": "Generate",
-        "data": {}, "is_create": True, "charges_json": [],
+        "data": {}, "is_create": True, "charges_json": [], "form_key": uuid.uuid4().hex,
+        "layouts": layout_names(), "default_layout": DEFAULT_LAYOUT,
     }
-    return render_template_string(HTML_FORM, **context)
+    return render_template(FORM_TEMPLATE, **context)
 
 @app.route("/generate", methods=["POST"])
 def generate():
+    from .pdf_generator import fill_pdf_with_overlay
+
+    try:
+        layout = _form_layout()
+    except ValueError as e:
+        return str(e), 400
     record = {
         "name": request.form.get("name", ""),
         "date": request.form.get("date", ""),
         "from_date": request.form.get("from_date", ""),
         "to_date": request.form.get("to_date", ""),
         "charges": normalize_charges_from_request(request.form),
+        "layout": layout,
     }
     record["total"] = compute_total_from_charges(record["charges"])
 
-    try:
-        insert_record(supabase, record)
-    except Exception as e:
-        print("❌ Supabase insert failed:", e)
+    # The record goes into the durable outbox first, then is upserted while the PDF renders.
+    # A resubmitted form has the same key, so it cannot create a second row.
+    key = idempotency_key(record, request.form.get("idempotency_key", ""))
+    outbox = get_outbox()
+    outbox.start()
+    outbox.add(key, record)
+    saving = persist_executor.submit(contextvars.copy_context().run, outbox.deliver, key, record)
 
     pdf_bytes = fill_pdf_with_overlay(TEMPLATE_PATH, record)
-    user_name = (record["name"] or "document").split("\n")[0].strip().replace(" ", "_")
-    filename = f"{user_name}.pdf"
-    return send_file(pdf_bytes, as_attachment=True, download_name=filename, mimetype="application/pdf")
+    try:
+        saved = saving.result(timeout=GENERATE_SAVE_WAIT_SECONDS)
+    except FutureTimeout:
+        saved = False
+    filename = pdf_filename(record["name"])
+    response = send_file(pdf_bytes, as_attachment=True, download_name=filename, mimetype="application/pdf")
+    status = "saved"
+    if not saved:
+        # "rejected": the database refused the record, so it is parked in the outbox rather than retried.
+        status = {"pending": "queued", "rejected": "rejected"}.get(outbox.status(key), "saved")
+    response.headers["X-Record-Status"] = status
+    return response
 
 @app.route("/records", methods=["GET"])
 def records():
+    page_size = min(max(request.args.get("page_size", RECORDS_PAGE_SIZE, type=int), 1), RECORDS_MAX_PAGE_SIZE)
+    cursor = request.args.get("cursor", type=int)
+    search = {k: request.args.get(k, "").strip() for k in SEARCH_FILTERS}
+    for k in ("total_min", "total_max"):
+        if search[k] and request.args.get(k, type=float) is None:
+            search[k] = ""
+    search = {k: v for k, v in search.items() if v}
+    try:
+        db = get_client()
+        rows, next_cursor = fetch_page(db, limit=page_size, before_id=cursor, filters=search)
+        fill_missing_totals(db, rows)
+        grand_total = fetch_grand_total(db, search)
+    except Exception as e:
+        record_error("supabase_fetch", e)
+        rows, next_cursor, grand_total = [], None, 0.0
+    return render_template(
+        RECORDS_TEMPLATE, title="Database Records", rows=rows, grand_total=grand_total,
+        page_size=page_size, cursor=cursor, next_cursor=next_cursor, search=search,
+    )
+
+@app.route("/import", methods=["POST"])
+def import_records():
+    """
+    Bulk import from an uploaded CSV or JSON Lines `file`. Rows are inserted in batches of
+    `batch_size`; `start_line` skips lines already imported by an earlier, interrupted upload
+    (a 503 response carries the `last_line` committed before the database became unavailable).
+    """
+    upload = request.files.get("file")
+    if upload is None:
+        return jsonify({"error": "No file uploaded"}), 400
+    fmt = request.form.get("format") or detect_format(upload.filename or "")
+    batch_size = request.form.get("batch_size", DEFAULT_BATCH_SIZE, type=int)
+    start_line = request.form.get("start_line", 0, type=int)
+    stream = io.TextIOWrapper(upload.stream, encoding="utf-8-sig", newline="")
+    committed = {"last_line": start_line}
     try:
-        rows = fetch_all(supabase)
-        for r in rows:
-            charges = migrate_row_to_charges_if_needed(r)
-            r["total"] = r.get("total") or compute_total_from_charges(charges)
-        grand_total = sum(float(r.get("total") or 0) for r in rows)
+        report = import_rows(
+            get_client(), iter_rows(stream, fmt), max(batch_size, 1), start_line,
+            on_batch=lambda last_line: committed.update(last_line=last_line),
+        )
     except Exception as e:
-        print("❌ Failed to fetch from Supabase:", e)
-        rows, grand_total = [], 0.0
-    return render_template_string(HTML_RECORDS, title="Database Records", rows=rows, grand_total=grand_total)
+        # Rows are keyed by line and content, so resending from `last_line` cannot duplicate them.
+        record_error("import", e)
+        return jsonify({"error": f"Database unavailable: {e}", "last_line": committed["last_line"]}), 503
+    return jsonify(report), (200 if not report["errors"] else 207)
+
+@app.route("/reports/totals", methods=["GET"])
+def report_totals():
+    """Totals grouped by `group_by` (month, customer or charge_type) over an optional `date_from`/`date_to` range."""
+    group_by = request.args.get("group_by", "month")
+    date_from, date_to = request.args.get("date_from"), request.args.get("date_to")
+    # Checked here: the database would reject a malformed date argument as a server error.
+    for value in (date_from, date_to):
+        try:
+            if value:
+                datetime.strptime(value, "%Y-%m-%d")
+        except ValueError:
+            return jsonify({"error": f"Invalid date '{value}', expected YYYY-MM-DD"}), 400
+    try:
+        rows = fetch_totals(get_client(), group_by, date_from, date_to)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({
+        "group_by": group_by, "date_from": date_from, "date_to": date_to,
+        "rows": rows, "total": sum(to_paise(r["total"]) for r in rows) / 100,
+    })
 
 @app.route("/print/<int:record_id>", methods=["GET"])
 def print_record(record_id: int):
-    record = fetch_one(supabase, record_id)
+    from .pdf_generator import fill_pdf_with_overlay, render_fingerprint
+
+    record = fetch_one(get_client(), record_id)
     if not record:
         return "Record not found", 404
-    charges = migrate_row_to_charges_if_needed(record)
-    total = record.get("total") or compute_total_from_charges(charges)
-    record_for_pdf = {
-        "name": record.get("name", ""),
-        "date": record.get("date", ""),
-        "from_date": record.get("from_date", ""),
-        "to_date": record.get("to_date", ""),
-        "charges": charges,
-        "total": total,
+    record_for_pdf = row_to_pdf_record(record)
+    etag = pdf_cache_key(record_for_pdf, render_fingerprint(TEMPLATE_PATH, record_for_pdf["layout"]))
+    if etag in request.if_none_match:
+        return "", 304, {"ETag": f'"{etag}"', "Cache-Control": "private, no-cache"}
+    pdf = pdf_cache.get(record_id, etag)
+    if pdf is None:
+        pdf = fill_pdf_with_overlay(TEMPLATE_PATH, record_for_pdf).getvalue()
+        pdf_cache.put(record_id, etag, pdf)
+    filename = pdf_filename(record.get("name", "document"), f"record_{record_id}")
+    response = send_file(io.BytesIO(pdf), as_attachment=True, download_name=filename, mimetype="application/pdf", etag=etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+def _export_selection(params):
+    """
+    Parses the `ids` (comma separated, or a JSON list), `date_from`/`date_to`, `name` and
+    `format` export parameters. Raises ValueError.
+    """
+    raw_ids = params.get("ids") or []
+    if not isinstance(raw_ids, list):
+        raw_ids = str(raw_ids).replace(" ", "").split(",")
+    try:
+        ids = [int(i) for i in raw_ids if str(i).strip()]
+    except (TypeError, ValueError):
+        raise ValueError("Invalid ids") from None
+    selection = {
+        "ids": ids, "date_from": params.get("date_from"), "date_to": params.get("date_to"),
+        "name": params.get("name"), "format": (params.get("format") or "pdf").lower(),
     }
-    pdf_bytes = fill_pdf_with_overlay(TEMPLATE_PATH, record_for_pdf)
-    user_name = str(record.get("name", "document")).split("\n")[0].strip().replace(" ", "_") or f"record_{record_id}"
-    filename = f"{user_name}.pdf"
-    return send_file(pdf_bytes, as_attachment=True, download_name=filename, mimetype="application/pdf")
+    if selection["format"] not in ("pdf", "zip"):
+        raise ValueError("Unsupported format")
+    if not (ids or selection["date_from"] or selection["date_to"] or selection["name"]):
+        raise ValueError("Provide ids, a date range or a name filter")
+    return selection
+
+@app.route("/export", methods=["GET", "POST"])
+def export_records():
+    """
+    Bulk export. Selects records by `ids` (comma separated), `date_from`/`date_to`
+    and/or `name`, and returns one merged PDF (`format=pdf`) or a ZIP of per-record PDFs.
+    The output is streamed as each invoice is rendered rather than assembled in memory.
+    """
+    from .batch import render_pdfs, stream_zip
+    from .pdf_stream import stream_merged_pdf
+
+    try:
+        selection = _export_selection(request.values)
+    except ValueError as e:
+        return str(e), 400
+    rows = fetch_many(
+        get_client(), ids=selection["ids"], date_from=selection["date_from"], date_to=selection["date_to"],
+        name=selection["name"], limit=EXPORT_MAX_RECORDS + 1,
+    )
+    if not rows:
+        return "No matching records", 404
+    if len(rows) > EXPORT_MAX_RECORDS:
+        return f"Too many records (max {EXPORT_MAX_RECORDS}); narrow the filter", 413
+    pdfs = render_pdfs(TEMPLATE_PATH, (row_to_pdf_record(r) for r in rows))
+    if selection["format"] == "zip":
+        names = (f"{r.get('id')}_{pdf_filename(r.get('name'), 'record')}" for r in rows)
+        body, filename, mimetype = stream_zip(zip(names, pdfs)), "invoices.zip", "application/zip"
+    else:
+        body, filename, mimetype = stream_merged_pdf(pdfs), "invoices.pdf", "application/pdf"
+    return Response(body, mimetype=mimetype, headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+@app.route("/jobs", methods=["POST"])
+def submit_job():
+    """
+    Queues a background render. Takes either `record_id` (one invoice) or the same
+    selection parameters as /export, as form fields or JSON. Responds 202 with the job id.
+    """
+    params = request.get_json(silent=True) or request.values
+    record_id = params.get("record_id")
+    try:
+        selection = {"ids": [int(record_id)], "format": "pdf"} if record_id else _export_selection(params)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    job_id = get_job_queue().submit(selection)
+    return jsonify({
+        "id": job_id, "status": "queued",
+        "status_url": url_for("job_status", job_id=job_id),
+        "download_url": url_for("job_download", job_id=job_id),
+    }), 202, {"Location": url_for("job_status", job_id=job_id)}
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id: str):
+    job = get_job_queue().status(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify({k: job[k] for k in ("id", "status", "total", "done", "progress", "error", "filename")})
+
+@app.route("/jobs/<job_id>/download", methods=["GET"])
+def job_download(job_id: str):
+    job = get_job_queue().status(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job["status"] != "done":
+        return jsonify({"error": f"Job is {job['status']}", "status": job["status"]}), 409
+    return send_file(job["result_path"], as_attachment=True, download_name=job["filename"], mimetype=job["mimetype"])
 
 @app.route("/edit/<int:record_id>", methods=["GET"])
 def edit_record(record_id: int):
-    record = fetch_one(supabase, record_id)
+    record = fetch_one(get_client(), record_id)
     if not record:
         return "Record not found", 404
     charges = migrate_row_to_charges_if_needed(record)
@@ -309,34 +645,49 @@ def edit_record(record_id: int):
             "from_date": record.get("from_date", ""),
             "to_date": record.get("to_date", ""),
             "total": record.get("total") or compute_total_from_charges(charges),
+            "layout": record.get("layout") or "",
         },
         "is_create": False,
         "charges_json": charges,
+        "version": record.get("version") or 1,
+        "layouts": layout_names(), "default_layout": DEFAULT_LAYOUT,
     }
-    return render_template_string(HTML_FORM, **context)
+    return render_template(FORM_TEMPLATE, **context)
 
 @app.route("/update/<int:record_id>", methods=["POST"])
 def update_record(record_id: int):
+    try:
+        layout = _form_layout()
+    except ValueError as e:
+        return str(e), 400
     record = {
         "name": request.form.get("name", ""),
         "date": request.form.get("date", ""),
         "from_date": request.form.get("from_date", ""),
         "to_date": request.form.get("to_date", ""),
         "charges": normalize_charges_from_request(request.form),
+        "layout": layout,
     }
     record["total"] = compute_total_from_charges(record["charges"])
     try:
-        update_record_db(supabase, record_id, record)
+        update_record_db(get_client(), record_id, record, expected_version=request.form.get("version", type=int))
+    except StaleRecordError:
+        return "This record was changed by someone else after you opened it. Reload the edit page and apply your changes again.", 409
+    except LookupError:
+        return "Record not found", 404
     except Exception as e:
-        print("❌ Supabase update failed:", e)
+        record_error("supabase_update", e)
+    finally:
+        pdf_cache.invalidate(record_id)
     return redirect(url_for("records"))
 
 @app.route("/delete/<int:record_id>", methods=["POST"])
 def delete_record(record_id: int):
     try:
-        delete_record_db(supabase, record_id)
+        delete_record_db(get_client(), record_id)
     except Exception as e:
-        print("❌ Supabase delete failed:", e)
+        record_error("supabase_delete", e)
+    pdf_cache.invalidate(record_id)
     return redirect(url_for("records"))
 
 # ----------------------------- Local Dev (Replit) ----------------------------- #
@@ -0,0 +1,160 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List
+from .db_manager import row_to_pdf_record
+from .helpers import pdf_filename
+from .metrics import record_error
+
+# Finished job results older than this are deleted when new jobs are submitted.
+JOB_RESULT_TTL_SECONDS = int(os.environ.get("JOB_RESULT_TTL_SECONDS", 24 * 3600))
+
+_SCHEMA = """
+create table if not exists jobs (
+    id text primary key,
+    status text not null,
+    params text not null,
+    total integer not null default 0,
+    done integer not null default 0,
+    error text,
+    result_path text,
+    filename text,
+    mimetype text,
+    created_at real not null,
+    updated_at real not null
+)
+"""
+
+class JobQueue:
+    """
+    Background render queue for single-node deployments. Jobs are persisted in a SQLite
+    file under `directory`, executed on a small thread pool (each job still fans its
+    rendering out over the batch process pool), and their output is written to disk.
+    Jobs that were queued or running when the process stopped are picked up again on start.
+
+    A job's params are a selection such as {"ids": [...], "date_from", "date_to", "name",
+    "format": "pdf"|"zip"}, resolved to database rows by `load_rows` when the job runs.
+    """
+
+    def __init__(self, directory: str, template_path: str, load_rows: Callable[[Dict[str, Any]], List[Dict[str, Any]]], workers: int = 2):
+        self.directory = directory
+        self.template_path = template_path
+        self.load_rows = load_rows
+        os.makedirs(directory, exist_ok=True)
+        self.db_path = os.path.join(directory, "jobs.sqlite3")
+        with self._connect() as conn:
+            conn.execute("pragma journal_mode=wal")
+            conn.execute(_SCHEMA)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="render-job")
+        self._started = False
+        self._start_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _update(self, job_id: str, **fields) -> None:
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{k} = ?" for k in fields)
+        with self._connect() as conn:
+            conn.execute(f"update jobs set {assignments} where id = ?", (*fields.values(), job_id))
+
+    def _ensure_started(self) -> None:
+        """Re-enqueues jobs interrupted by a previous shutdown, once per process."""
+        with self._start_lock:
+            if self._started:
+                return
+            self._started = True
+            with self._connect() as conn:
+                pending = [r["id"] for r in conn.execute("select id from jobs where status in ('queued', 'running') order by created_at")]
+            for job_id in pending:
+                self._executor.submit(self._run, job_id)
+
+    def submit(self, params: Dict[str, Any]) -> str:
+        """Persists a new job and schedules it. Returns the job id."""
+        self._ensure_started()
+        self.purge_expired()
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "insert into jobs (id, status, params, created_at, updated_at) values (?, 'queued', ?, ?, ?)",
+                (job_id, json.dumps(params), now, now),
+            )
+        self._executor.submit(self._run, job_id)
+        return job_id
+
+    def status(self, job_id: str) -> Dict[str, Any] | None:
+        """Returns the job's state and progress, or None for an unknown id."""
+        self._ensure_started()
+        with self._connect() as conn:
+            row = conn.execute("select * from jobs where id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["progress"] = round(job["done"] / job["total"], 4) if job["total"] else (1.0 if job["status"] == "done" else 0.0)
+        return job
+
+    def purge_expired(self) -> None:
+        cutoff = time.time() - JOB_RESULT_TTL_SECONDS
+        with self._connect() as conn:
+            expired = conn.execute("select id, result_path from jobs where status in ('done', 'failed') and updated_at < ?", (cutoff,)).fetchall()
+            for row in expired:
+                if row["result_path"]:
+                    try:
+                        os.remove(row["result_path"])
+                    except FileNotFoundError:
+                        pass
+            conn.executemany("delete from jobs where id = ?", [(row["id"],) for row in expired])
+
+    def _track(self, job_id: str, pdfs: Iterable[bytes]) -> Iterator[bytes]:
+        done = 0
+        for pdf in pdfs:
+            done += 1
+            self._update(job_id, done=done)
+            yield pdf
+
+    def _run(self, job_id: str) -> None:
+        from .batch import render_pdfs, stream_zip
+        from .pdf_stream import stream_merged_pdf
+
+        job = self.status(job_id)
+        if job is None or job["status"] not in ("queued", "running"):
+            return
+        params = job["params"]
+        self._update(job_id, status="running", done=0, error=None)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        try:
+            rows = self.load_rows(params)
+            if not rows:
+                raise ValueError("No matching records")
+            records = [row_to_pdf_record(r) for r in rows]
+            names = [f"{r.get('id')}_{pdf_filename(r.get('name'), 'record')}" for r in rows]
+            fmt = params.get("format", "pdf")
+            self._update(job_id, total=len(records))
+            pdfs = self._track(job_id, render_pdfs(self.template_path, records))
+            if fmt == "zip":
+                chunks, filename, mimetype = stream_zip(zip(names, pdfs)), "invoices.zip", "application/zip"
+            else:
+                chunks, mimetype = stream_merged_pdf(pdfs), "application/pdf"
+                filename = pdf_filename(rows[0].get("name"), f"record_{rows[0].get('id')}") if len(rows) == 1 else "invoices.pdf"
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            result_path = os.path.join(self.directory, f"{job_id}.{fmt}")
+            os.replace(tmp_path, result_path)
+            self._update(job_id, status="done", result_path=result_path, filename=filename, mimetype=mimetype)
+        except Exception as e:
+            record_error("render_job", e)
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            self._update(job_id, status="failed", error=str(e))
@@ -0,0 +1,196 @@
+"""
+Declarative invoice layouts.
+
+Each layouts/<name>.json says where the overlay draws the customer block, the dates,
+the charges table and the closing note, and optionally which template PDF it belongs to
+("template", relative to the spec file; without it the caller's template is used).
+A record picks its layout through its `layout` field, so one deployment can serve every
+business unit. Specs are compiled once into a render plan - absolute coordinates, column
+edges, page capacity - and cached by path and mtime, so requests never re-read or
+re-interpret them.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from typing import Any, Dict, List, Tuple
+
+LAYOUTS_DIR = os.environ.get("LAYOUTS_DIR") or os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "layouts"))
+# Layout for records that do not name one.
+DEFAULT_LAYOUT = os.environ.get("DEFAULT_LAYOUT", "default")
+
+DATE_FIELDS = ("date", "from_date", "to_date")
+_NAME_RE = re.compile(r"^[A-Za-z0-9_-]+$")
+
+logger = logging.getLogger(__name__)
+
+# Compiled plans keyed by spec path: (mtime_ns, size, plan).
+_PLAN_CACHE: Dict[str, Tuple[int, int, Dict[str, Any]]] = {}
+_PLAN_CACHE_LOCK = threading.Lock()
+
+def layout_names() -> List[str]:
+    """Names of the layouts available in LAYOUTS_DIR."""
+    try:
+        files = os.listdir(LAYOUTS_DIR)
+    except FileNotFoundError:
+        return []
+    return sorted(f[:-5] for f in files if f.endswith(".json") and _NAME_RE.match(f[:-5]))
+
+def layout_path(name: str | None) -> str:
+    """Spec file of a layout (DEFAULT_LAYOUT when empty). Raises ValueError for unknown layouts."""
+    name = (name or "").strip() or DEFAULT_LAYOUT
+    if not _NAME_RE.match(name):
+        raise ValueError(f"Invalid layout name '{name}'")
+    path = os.path.join(LAYOUTS_DIR, f"{name}.json")
+    if not os.path.isfile(path):
+        raise ValueError(f"Unknown layout '{name}'")
+    return path
+
+def load_layout(name: str | None = None) -> Dict[str, Any]:
+    """Returns the compiled render plan of a layout, compiling it on first use or after the spec changed."""
+    path = layout_path(name)
+    st = os.stat(path)
+    cached = _PLAN_CACHE.get(path)
+    if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+        return cached[2]
+    with _PLAN_CACHE_LOCK:
+        cached = _PLAN_CACHE.get(path)
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            return cached[2]
+        with open(path, "rb") as f:
+            raw = f.read()
+        try:
+            spec = json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Layout '{os.path.basename(path)}' is not valid JSON: {e}") from None
+        plan = compile_layout(spec, os.path.basename(path)[:-5], os.path.dirname(path))
+        plan["fingerprint"] = hashlib.sha256(raw).hexdigest()
+        _PLAN_CACHE[path] = (st.st_mtime_ns, st.st_size, plan)
+        return plan
+
+def stored_layout(name: str | None) -> str | None:
+    """
+    The layout to render a stored record with: its own, or None (DEFAULT_LAYOUT) with a warning
+    when that layout has since been renamed, removed or broken, so old invoices still print.
+    """
+    if not name:
+        return None
+    try:
+        load_layout(name)
+    except (ValueError, OSError) as e:
+        logger.warning("Layout '%s' of a stored record is unusable (%s); using '%s'", name, e, DEFAULT_LAYOUT)
+        return None
+    return name
+
+def _get(spec: Dict[str, Any], dotted: str, layout: str, default: Any = ...) -> Any:
+    value: Any = spec
+    for part in dotted.split("."):
+        if not isinstance(value, dict) or part not in value:
+            if default is not ...:
+                return default
+            raise ValueError(f"Layout '{layout}': missing {dotted}")
+        value = value[part]
+    return value
+
+def _num(spec: Dict[str, Any], dotted: str, layout: str, default: Any = ...) -> float:
+    value = _get(spec, dotted, layout, default)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"Layout '{layout}': {dotted} must be a number")
+    return value
+
+def compile_layout(spec: Dict[str, Any], name: str, base_dir: str) -> Dict[str, Any]:
+    """
+    Turns a layout spec into the plan the overlay renderer draws from. Table text
+    positions match what Table/TableStyle produce: 6pt horizontal padding, MIDDLE valign
+    with the default 12pt leading (baseline at row bottom + 15 - font size).
+    Raises ValueError for missing or malformed entries.
+    """
+    template = spec.get("template")
+    page_w, page_h = _get(spec, "page_size", name, [612, 792])
+
+    fields = _get(spec, "fields", name)
+    unknown = set(fields) - {"name", *DATE_FIELDS}
+    if unknown:
+        raise ValueError(f"Layout '{name}': unknown fields {sorted(unknown)}")
+    name_field = None
+    if "name" in fields:
+        font = _get(spec, "fields.name.font", name)
+        name_field = (
+            _num(spec, "fields.name.x", name), _num(spec, "fields.name.y", name),
+            _get(spec, "fields.name.first_line_font", name, font), font,
+            _num(spec, "fields.name.size", name), _num(spec, "fields.name.leading", name),
+        )
+    date_fields = [
+        (field, _get(spec, f"fields.{field}.font", name), _num(spec, f"fields.{field}.size", name),
+         _num(spec, f"fields.{field}.x", name), _num(spec, f"fields.{field}.y", name))
+        for field in DATE_FIELDS if field in fields
+    ]
+
+    left, top = _num(spec, "table.left", name), _num(spec, "table.top", name)
+    bottom = _num(spec, "table.bottom", name)
+    widths = _get(spec, "table.column_widths", name)
+    header = _get(spec, "table.header", name)
+    if len(widths) != 4 or len(header) != 4:
+        raise ValueError(f"Layout '{name}': the table has 4 columns (SR, particular, amount, remark)")
+    row_height = _num(spec, "table.row_height", name)
+    font_size, header_font_size = _num(spec, "table.font_size", name), _num(spec, "table.header_font_size", name)
+    col_x = [left]
+    for w in widths:
+        col_x.append(col_x[-1] + w)
+    pad = 6
+
+    note_lines = [str(line) for line in _get(spec, "note.lines", name, [])]
+    note_gap, note_leading = _num(spec, "note.gap", name, 40), _num(spec, "note.leading", name, 14)
+    note_height = note_gap + max(len(note_lines) - 1, 0) * note_leading
+    max_rows = int((top - bottom) // row_height)
+    max_rows_last = int((top - bottom - note_height) // row_height)
+    # A continuation page needs the header, BROUGHT FORWARD, one charge and a closing row.
+    if max_rows < 4 or max_rows_last < 4:
+        raise ValueError(f"Layout '{name}': the table area is too small for the header, totals and note")
+
+    return {
+        "name": name,
+        "template": os.path.abspath(os.path.join(base_dir, template)) if template else None,
+        "page_size": (page_w, page_h),
+        "name_field": name_field,
+        "date_fields": date_fields,
+        "left": left,
+        "top": top,
+        "widths": list(widths),
+        "row_height": row_height,
+        "font": _get(spec, "table.font", name),
+        "bold_font": _get(spec, "table.bold_font", name),
+        "font_size": font_size,
+        "header_font_size": header_font_size,
+        "grid_width": _num(spec, "table.grid_width", name, 0.8),
+        "header_text": [str(h) for h in header],
+        "col_x": col_x,
+        "right": col_x[-1],
+        "width": col_x[-1] - left,
+        "header_baseline": 15 - header_font_size,
+        "body_baseline": 15 - font_size,
+        "sr_x": col_x[0] + widths[0] / 2.0,
+        "particular_x": col_x[1] + pad,
+        "total_label_x": col_x[2] - pad,
+        "amount_x": col_x[3] - pad,
+        "remark_x": col_x[3] + pad,
+        "header": [
+            ("centred", col_x[0] + widths[0] / 2.0, str(header[0])),
+            ("left", col_x[1] + pad, str(header[1])),
+            ("left", col_x[2] + pad, str(header[2])),
+            ("left", col_x[3] + pad, str(header[3])),
+        ],
+        "note_lines": note_lines,
+        "note_font": _get(spec, "note.font", name, "Times-Roman"),
+        "note_size": _num(spec, "note.size", name, 12),
+        "note_gap": note_gap,
+        "note_leading": note_leading,
+        "page_label_y": _num(spec, "page_label.y", name, 30),
+        "page_label_font": _get(spec, "page_label.font", name, "Times-Roman"),
+        "page_label_size": _num(spec, "page_label.size", name, 10),
+        # table rows (header and summary rows included) that fit on a page
+        "max_rows": max_rows,
+        "max_rows_last": max_rows_last,
+    }
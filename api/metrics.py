@@ -0,0 +1,151 @@
+"""
+In-process request metrics rendered in the Prometheus text format (GET /metrics).
+
+Histograms cover route latency, per-phase time (db, overlay, merge, serialize) and
+response size; counters cover errors. Values are per process: on serverless each
+warm instance reports its own series, which Prometheus aggregates by instance.
+"""
+import bisect
+import contextvars
+import cProfile
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 5e6, 2.5e7, 1e8)
+
+# Profiles are only taken when the X-Profile request header equals this token.
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN", "")
+PROFILE_DIR = os.environ.get("PROFILE_DIR") or os.path.join(tempfile.gettempdir(), "invoiceforge-profiles")
+
+Labels = Tuple[Tuple[str, str], ...]
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: Iterable[float]):
+        self.name, self.help, self.buckets = name, help_text, tuple(buckets)
+        self._series: Dict[Labels, List[float]] = {}  # labels -> bucket counts + [sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            series[bisect.bisect_left(self.buckets, value)] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        for labels, series in sorted(items):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                yield f"{self.name}_bucket{_labels(labels + (('le', _number(bound)),))} {int(cumulative)}"
+            yield f"{self.name}_sum{_labels(labels)} {series[-2]:.6f}"
+            yield f"{self.name}_count{_labels(labels)} {int(series[-1])}"
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name, self.help = name, help_text
+        self._series: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = sorted(self._series.items())
+        for labels, value in items:
+            yield f"{self.name}{_labels(labels)} {_number(value)}"
+
+REQUEST_SECONDS = Histogram("invoiceforge_request_seconds", "Request latency by route.", LATENCY_BUCKETS)
+PHASE_SECONDS = Histogram("invoiceforge_phase_seconds", "Time spent per request phase (db, overlay, merge, serialize).", LATENCY_BUCKETS)
+RESPONSE_BYTES = Histogram("invoiceforge_response_bytes", "Response body size by route.", SIZE_BUCKETS)
+ERRORS = Counter("invoiceforge_errors_total", "Handled errors by operation.")
+REGISTRY = (REQUEST_SECONDS, PHASE_SECONDS, RESPONSE_BYTES, ERRORS)
+
+# Phase totals of the current request, for the Server-Timing header.
+_request_phases: contextvars.ContextVar[Dict[str, float] | None] = contextvars.ContextVar("request_phases", default=None)
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Times a block as one phase of the current request (and in the phase histogram)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        PHASE_SECONDS.observe(elapsed, phase=name)
+        phases = _request_phases.get()
+        if phases is not None:
+            phases[name] = phases.get(name, 0.0) + elapsed
+
+def start_request() -> None:
+    _request_phases.set({})
+
+def request_phases() -> Dict[str, float]:
+    return dict(_request_phases.get() or {})
+
+def record_error(operation: str, exc: Exception) -> None:
+    """Counts a handled error and logs it."""
+    ERRORS.inc(operation=operation, error=type(exc).__name__)
+    logger.error("%s failed: %s", operation, exc)
+
+def count_bytes(chunks: Iterable[bytes], route: str) -> Iterator[bytes]:
+    """Passes a streamed body through, observing its total size once it has been sent."""
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        yield chunk
+    RESPONSE_BYTES.observe(size, route=route)
+
+def render_metrics() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+def render_gauge(name: str, help_text: str, series: Iterable[Tuple[Dict[str, str], float]]) -> str:
+    """A gauge read at scrape time (e.g. outbox size), in the same text format."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+    lines += [f"{name}{_labels(tuple(sorted(labels.items())))} {_number(value)}" for labels, value in series]
+    return "\n".join(lines) + "\n"
+
+def profile_requested(header_value: str | None) -> bool:
+    return bool(PROFILE_TOKEN) and header_value == PROFILE_TOKEN
+
+def save_profile(profiler: cProfile.Profile, label: str) -> str:
+    """Writes the profile to PROFILE_DIR (open it with pstats or snakeviz) and logs where it went."""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    safe_label = "".join(c if c.isalnum() else "_" for c in label).strip("_") or "request"
+    path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{safe_label}-{os.getpid()}.prof")
+    profiler.dump_stats(path)
+    logger.info("Profile for %s saved to %s", label, path)
+    return os.path.basename(path)
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
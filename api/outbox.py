@@ -0,0 +1,138 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Tuple
+from .metrics import ERRORS, record_error
+
+_SCHEMA = """
+create table if not exists outbox (
+    key text primary key,
+    payload text not null,
+    attempts integer not null default 0,
+    last_error text,
+    created_at real not null,
+    next_attempt_at real not null,
+    status text not null default 'pending'
+)
+"""
+
+# Outbox files created before entries could be parked lack the status column.
+_ADD_STATUS = "alter table outbox add column status text not null default 'pending'"
+
+class Outbox:
+    """
+    Durable local queue of records waiting to be written to the database, keyed by their
+    idempotency key. A record is added before the write is attempted and removed once it
+    succeeds, so a failed or interrupted write is retried (with backoff) by `start`'s
+    background thread instead of being lost. The writes must be idempotent on the key.
+    A write that fails with an error `is_rejection` accepts (the database refused the
+    record, so retrying cannot help) parks the entry as "rejected" with its last_error,
+    for /metrics and an operator to pick up, instead of rescheduling it.
+    """
+
+    def __init__(self, path: str, write: Callable[[str, Dict[str, Any]], Any], retry_seconds: float = 30.0,
+                 is_rejection: Callable[[Exception], bool] = lambda e: False):
+        self.path = path
+        self.write = write
+        self.retry_seconds = retry_seconds
+        self.is_rejection = is_rejection
+        with self._connect() as conn:
+            conn.execute("pragma journal_mode=wal")
+            conn.execute(_SCHEMA)
+            if "status" not in {row[1] for row in conn.execute("pragma table_info(outbox)")}:
+                conn.execute(_ADD_STATUS)
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def add(self, key: str, record: Dict[str, Any]) -> None:
+        """Stores a record. The background thread only picks it up if `deliver` has not succeeded within retry_seconds."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "insert or ignore into outbox (key, payload, created_at, next_attempt_at) values (?, ?, ?, ?)",
+                (key, json.dumps(record), now, now + self.retry_seconds),
+            )
+
+    def deliver(self, key: str, record: Dict[str, Any]) -> bool:
+        """Attempts one write. Removes the entry on success; otherwise schedules a retry with backoff."""
+        try:
+            self.write(key, record)
+        except Exception as e:
+            record_error("outbox_write", e)
+            with self._connect() as conn:
+                if self.is_rejection(e):
+                    conn.execute(
+                        "update outbox set attempts = attempts + 1, last_error = ?, status = 'rejected' where key = ?",
+                        (str(e), key),
+                    )
+                    return False
+                conn.execute(
+                    "update outbox set attempts = attempts + 1, last_error = ?,"
+                    " next_attempt_at = ? + min(? * (1 << min(attempts, 6)), 3600) where key = ?",
+                    (str(e), time.time(), self.retry_seconds, key),
+                )
+            return False
+        with self._connect() as conn:
+            conn.execute("delete from outbox where key = ?", (key,))
+        return True
+
+    def due(self, limit: int = 100) -> List[Tuple[str, Dict[str, Any]]]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "select key, payload from outbox where status = 'pending' and next_attempt_at <= ? order by created_at limit ?",
+                (time.time(), limit),
+            ).fetchall()
+        return [(key, json.loads(payload)) for key, payload in rows]
+
+    def pending_count(self) -> int:
+        return self.counts().get("pending", 0)
+
+    def status(self, key: str) -> str | None:
+        """"pending" or "rejected" for a queued entry, None once it has been written."""
+        with self._connect() as conn:
+            row = conn.execute("select status from outbox where key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def counts(self) -> Dict[str, int]:
+        """Number of entries per status ("pending", "rejected")."""
+        with self._connect() as conn:
+            return dict(conn.execute("select status, count(*) from outbox group by status").fetchall())
+
+    def rejected(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """Parked entries, oldest first, with the error the database gave."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "select key, payload, attempts, last_error, created_at from outbox"
+                " where status = 'rejected' order by created_at limit ?",
+                (limit,),
+            ).fetchall()
+        return [
+            {"key": key, "record": json.loads(payload), "attempts": attempts, "last_error": error, "created_at": created}
+            for key, payload, attempts, error, created in rows
+        ]
+
+    def drain(self) -> int:
+        """Delivers every entry whose retry time has come. Returns how many were written."""
+        written = 0
+        for key, record in self.due():
+            written += self.deliver(key, record)
+        return written
+
+    def start(self) -> None:
+        """Starts the background retry thread, once per process."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="outbox", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.drain()
+            except Exception as e:
+                ERRORS.inc(operation="outbox_drain", error=type(e).__name__)
+            time.sleep(self.retry_seconds)
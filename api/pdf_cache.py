@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Set
+
+# Bump when the rendering code changes in a way that alters the output for the same input.
+RENDER_VERSION = "4"
+
+def pdf_cache_key(record_for_pdf: Dict[str, Any], render_fingerprint: str) -> str:
+    """Content address of a rendered invoice: hash of the normalized record data and the template/renderer."""
+    payload = json.dumps(record_for_pdf, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(f"{RENDER_VERSION}\0{render_fingerprint}\0{payload}".encode()).hexdigest()
+
+class NullPdfCache:
+    """Cache backend that stores nothing (PDF_CACHE=off)."""
+
+    def get(self, record_id: int, key: str) -> bytes | None:
+        return None
+
+    def put(self, record_id: int, key: str, data: bytes) -> None:
+        pass
+
+    def invalidate(self, record_id: int) -> None:
+        pass
+
+class MemoryPdfCache:
+    """In-process LRU cache of rendered PDFs, evicting least recently used entries past `max_bytes`."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[str, tuple[int, bytes]]" = OrderedDict()
+        self._by_record: Dict[int, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, record_id: int, key: str) -> bytes | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, record_id: int, key: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = (record_id, data)
+            self._by_record.setdefault(record_id, set()).add(key)
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, record_id: int) -> None:
+        with self._lock:
+            for key in self._by_record.pop(record_id, set()):
+                self._drop(key)
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        record_id, data = entry
+        self.size -= len(data)
+        keys = self._by_record.get(record_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_record[record_id]
+
+class DiskPdfCache:
+    """
+    On-disk cache stored as <directory>/<record_id>/<key>.pdf. Hits refresh the file's
+    mtime, and the oldest files are removed once the directory grows past `max_bytes`.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size: int | None = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, record_id: int, key: str) -> str:
+        return os.path.join(self.directory, str(int(record_id)), f"{key}.pdf")
+
+    def _files(self):
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(".pdf"):
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    yield path, st.st_size, st.st_mtime
+
+    def get(self, record_id: int, key: str) -> bytes | None:
+        path = self._path(record_id, key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def put(self, record_id: int, key: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(record_id, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._files())
+            else:
+                self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def invalidate(self, record_id: int) -> None:
+        shutil.rmtree(os.path.join(self.directory, str(int(record_id))), ignore_errors=True)
+        with self._lock:
+            self._size = None
+
+    def _evict(self) -> None:
+        files = sorted(self._files(), key=lambda f: f[2])
+        size = sum(f[1] for f in files)
+        target = self.max_bytes * 0.9
+        for path, file_size, _ in files:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+                size -= file_size
+            except FileNotFoundError:
+                pass
+        self._size = size
+
+def cache_from_env():
+    """Builds the cache backend selected by PDF_CACHE (memory, disk or off)."""
+    backend = os.environ.get("PDF_CACHE", "memory").lower()
+    if backend == "off":
+        return NullPdfCache()
+    if backend == "disk":
+        directory = os.environ.get("PDF_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "invoiceforge-pdf-cache")
+        return DiskPdfCache(directory, int(os.environ.get("PDF_CACHE_MAX_BYTES", 512 * 1024 * 1024)))
+    return MemoryPdfCache(int(os.environ.get("PDF_CACHE_MAX_BYTES", 64 * 1024 * 1024)))
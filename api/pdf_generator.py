@@ -1,94 +1,262 @@
+import hashlib
 import io
 import os
-from typing import Dict, Any
+import threading
+from typing import Dict, Any, List, Tuple
 from reportlab.pdfgen import canvas
-from reportlab.platypus import Table, TableStyle
 from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
 from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import NameObject
 from .helpers import to_number, format_date_ddmmyyyy
+from .charges import format_paise, to_paise
+from .layouts import load_layout
+from .metrics import phase
 
-PAGE_W, PAGE_H = letter
+# Parsed templates keyed by absolute path: (mtime_ns, size, reader, lock, sha256 of the file).
+_TEMPLATE_CACHE: Dict[str, Tuple[int, int, PdfReader, threading.Lock, str]] = {}
+_TEMPLATE_CACHE_LOCK = threading.Lock()
 
-def create_overlay_pdf(data: Dict[str, Any]) -> io.BytesIO:
-    """Creates an in-memory PDF overlay with dynamic data."""
-    buf = io.BytesIO()
-    can = canvas.Canvas(buf, pagesize=(PAGE_W, PAGE_H))
-    name_lines = str(data.get("name", "")).splitlines()
-    can.setFont("Times-Bold", 12)
-    if name_lines:
-        can.drawString(73, 656, name_lines[0].strip())
-    can.setFont("Times-Roman", 12)
-    for i, line in enumerate(name_lines[1:], start=1):
-        if line.strip():
-            can.drawString(73, 656 - (i * 14), line.strip())
-    date = format_date_ddmmyyyy(data.get("date", ""))
-    from_date = format_date_ddmmyyyy(data.get("from_date", ""))
-    to_date = format_date_ddmmyyyy(data.get("to_date", ""))
-    can.setFont("Times-Roman", 11)
-    can.drawString(467, 715, date)
-    can.drawString(310, 547, from_date)
-    can.drawString(385, 547, to_date)
+# "fast" draws the table straight onto the canvas from the layout's render plan;
+# "table" builds a ReportLab Table per invoice (the original implementation).
+OVERLAY_RENDERER = os.environ.get("OVERLAY_RENDERER", "fast")
+
+def paginate_rows(num_rows: int, plan: Dict[str, Any] | None = None) -> List[Tuple[int, int]]:
+    """
+    Splits `num_rows` charge rows into per-page [start, end) slices. Every page has the
+    header row and a closing row (CARRIED FORWARD, or TOTAL on the last page); pages after
+    the first also open with BROUGHT FORWARD, and only the last page must fit the note.
+    """
+    L = plan or load_layout()
+    pages: List[Tuple[int, int]] = []
+    start = 0
+    while True:
+        fixed = 3 if pages else 2
+        remaining = num_rows - start
+        if remaining <= L["max_rows_last"] - fixed:
+            pages.append((start, num_rows))
+            return pages
+        take = min(L["max_rows"] - fixed, remaining - 1)
+        if take < 1:
+            raise ValueError(f"Layout '{L['name']}' has no room for charge rows on a page")
+        pages.append((start, start + take))
+        start += take
+
+def _charge_rows(data: Dict[str, Any]) -> Tuple[list, List[int]]:
+    """Returns (sr, particular, amount, remark) strings for the charges worth printing, plus their amounts in paise."""
     charges = data.get("charges") or []
     filtered_charges = [ch for ch in charges if str(ch.get("type", "")).strip() or str(ch.get("remark", "")).strip() or to_number(ch.get("amount", 0)) > 0]
-    table_data = [["SR", "PARTICULAR", "AMOUNT", "REMARK"]]
-    for i, ch in enumerate(filtered_charges, start=1):
-        table_data.append([str(i), str(ch.get("type", "")), f"{to_number(ch.get('amount', 0)):.2f}", str(ch.get("remark", ""))])
-    table_data.append(["", "TOTAL", f"{to_number(data.get('total', 0)):.2f}", ""])
-    TABLE_LEFT, TABLE_TOP_Y = 60, 510
-    TABLE_WIDTHS, ROW_HEIGHT = [40, 230, 90, 132], 18
-    FONT_SIZE_BODY, FONT_SIZE_HEADER = 10, 11
+    # Rounded like the stored total, so the printed lines add up to the TOTAL row.
+    amounts = [to_paise(ch.get("amount", 0)) for ch in filtered_charges]
+    rows = [
+        [str(i), str(ch.get("type", "")), format_paise(paise), str(ch.get("remark", ""))]
+        for i, (ch, paise) in enumerate(zip(filtered_charges, amounts), start=1)
+    ]
+    return rows, amounts
+
+def _draw_summary_row_fast(can: canvas.Canvas, L: Dict[str, Any], row_bottom: float, label: str, amount: str) -> None:
+    y = row_bottom + L["body_baseline"]
+    can.setFont(L["bold_font"], L["font_size"])
+    can.drawRightString(L["total_label_x"], y, label)
+    can.drawRightString(L["amount_x"], y, amount)
+
+def _draw_table_fast(can: canvas.Canvas, L: Dict[str, Any], rows: list, footer: Tuple[str, str], lead: Tuple[str, str] | None = None) -> float:
+    """Draws the charges table directly on the canvas. Returns the table's bottom y."""
+    top, left, row_height = L["top"], L["left"], L["row_height"]
+    num_rows = len(rows) + (3 if lead else 2)
+    bottom = top - num_rows * row_height
+    header_bottom = top - row_height
+    can.saveState()
+    can.setFillColor(colors.white)
+    can.rect(left, header_bottom, L["width"], row_height, stroke=0, fill=1)
+    if lead:
+        can.rect(left, header_bottom - row_height, L["width"], row_height, stroke=0, fill=1)
+    can.rect(left, bottom, L["width"], row_height, stroke=0, fill=1)
+    can.setFillColor(colors.black)
+
+    can.setFont(L["bold_font"], L["header_font_size"])
+    y = header_bottom + L["header_baseline"]
+    for align, x, text in L["header"]:
+        if align == "centred":
+            can.drawCentredString(x, y, text)
+        else:
+            can.drawString(x, y, text)
+
+    row_bottom = header_bottom
+    if lead:
+        row_bottom -= row_height
+        _draw_summary_row_fast(can, L, row_bottom, *lead)
+    can.setFont(L["font"], L["font_size"])
+    for sr, particular, amount, remark in rows:
+        row_bottom -= row_height
+        y = row_bottom + L["body_baseline"]
+        can.drawCentredString(L["sr_x"], y, sr)
+        can.drawString(L["particular_x"], y, particular)
+        can.drawRightString(L["amount_x"], y, amount)
+        can.drawString(L["remark_x"], y, remark)
+    _draw_summary_row_fast(can, L, bottom, *footer)
+
+    can.setStrokeColor(colors.black)
+    can.setLineWidth(L["grid_width"])
+    can.setLineCap(1)
+    can.setLineJoin(1)
+    lines = [(left, top - i * row_height, L["right"], top - i * row_height) for i in range(num_rows + 1)]
+    lines += [(x, top, x, bottom) for x in L["col_x"]]
+    can.lines(lines)
+    can.restoreState()
+    return bottom
+
+def _draw_table_platypus(can: canvas.Canvas, L: Dict[str, Any], rows: list, footer: Tuple[str, str], lead: Tuple[str, str] | None = None) -> float:
+    """Draws the charges table with a ReportLab Table. Returns the table's bottom y."""
+    from reportlab.platypus import Table, TableStyle  # slow import, only needed by this renderer
+    lead_rows = [["", lead[0], lead[1], ""]] if lead else []
+    table_data = [L["header_text"]] + lead_rows + rows + [["", footer[0], footer[1], ""]]
     num_rows = len(table_data)
-    tbl = Table(table_data, colWidths=TABLE_WIDTHS, rowHeights=[ROW_HEIGHT] * num_rows)
-    tbl.setStyle(TableStyle([
-        ("GRID", (0, 0), (-1, -1), 0.8, colors.black),
+    tbl = Table(table_data, colWidths=L["widths"], rowHeights=[L["row_height"]] * num_rows)
+    style = [
+        ("GRID", (0, 0), (-1, -1), L["grid_width"], colors.black),
         ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
         ("ALIGN", (0, 0), (0, -1), "CENTER"),
-        ("FONTNAME", (0, 0), (-1, 0), "Times-Bold"),
-        ("FONTSIZE", (0, 0), (-1, 0), FONT_SIZE_HEADER),
+        ("FONTNAME", (0, 0), (-1, 0), L["bold_font"]),
+        ("FONTSIZE", (0, 0), (-1, 0), L["header_font_size"]),
         ("BACKGROUND", (0, 0), (-1, 0), colors.white),
         ("TEXTCOLOR", (0, 0), (-1, 0), colors.black),
-        ("FONTNAME", (0, 1), (-1, -1), "Times-Roman"),
-        ("FONTSIZE", (0, 1), (-1, -1), FONT_SIZE_BODY),
-        ("FONTNAME", (1, -1), (2, -1), "Times-Bold"),
+        ("FONTNAME", (0, 1), (-1, -1), L["font"]),
+        ("FONTSIZE", (0, 1), (-1, -1), L["font_size"]),
+        ("FONTNAME", (1, -1), (2, -1), L["bold_font"]),
         ("ALIGN", (1, -1), (1, -1), "RIGHT"),
         ("ALIGN", (2, 1), (2, -1), "RIGHT"),
         ("ALIGN", (2, -1), (2, -1), "RIGHT"),
         ("BACKGROUND", (0, -1), (-1, -1), colors.white),
         ("TEXTCOLOR", (0, -1), (-1, -1), colors.black),
         ("SPAN", (0, -1), (0, -1)),
-    ]))
-    table_height = num_rows * ROW_HEIGHT
-    table_bottom_y = TABLE_TOP_Y - table_height
-    tbl.wrapOn(can, TABLE_LEFT, table_bottom_y)
-    tbl.drawOn(can, TABLE_LEFT, table_bottom_y)
-    note_text = """Please credit the expenses in our account
-Account Name :- Sai Agro Inputs
-Account No. :- 921020042670090
-IFSC Code :- UTIB0000749
-Bank :- Axis Bank
-Branch :- Amankha Plot Road Akola"""
-    can.setFont("Times-Roman", 12)
-    text_x, text_y = TABLE_LEFT, table_bottom_y - 40
-    for line in note_text.splitlines():
-        can.drawString(text_x, text_y, line)
-        text_y -= 14
+    ]
+    if lead:
+        style += [
+            ("FONTNAME", (1, 1), (2, 1), L["bold_font"]),
+            ("ALIGN", (1, 1), (1, 1), "RIGHT"),
+            ("BACKGROUND", (0, 1), (-1, 1), colors.white),
+        ]
+    tbl.setStyle(TableStyle(style))
+    table_bottom_y = L["top"] - num_rows * L["row_height"]
+    tbl.wrapOn(can, L["left"], table_bottom_y)
+    tbl.drawOn(can, L["left"], table_bottom_y)
+    return table_bottom_y
+
+def create_overlay_pdf(data: Dict[str, Any], renderer: str | None = None, plan: Dict[str, Any] | None = None) -> io.BytesIO:
+    """
+    Creates an in-memory PDF overlay with dynamic data, one page per template page needed.
+    Charges that do not fit on one page continue on the next with running subtotals.
+    Positions come from `plan` (default: the record's layout); `renderer` ("fast" or
+    "table") overrides the OVERLAY_RENDERER setting.
+    """
+    L = plan or load_layout(data.get("layout"))
+    buf = io.BytesIO()
+    can = canvas.Canvas(buf, pagesize=L["page_size"])
+    name_lines = [line.strip() for line in str(data.get("name", "")).splitlines()]
+    dates = [(font, size, x, y, format_date_ddmmyyyy(data.get(field, ""))) for field, font, size, x, y in L["date_fields"]]
+    rows, amounts = _charge_rows(data)
+    total = format_paise(to_paise(data.get("total", 0)))
+    draw_table = _draw_table_platypus if (renderer or OVERLAY_RENDERER) == "table" else _draw_table_fast
+    pages = paginate_rows(len(rows), L)
+    carried = 0  # paise, so running subtotals are exact
+    for page_no, (start, end) in enumerate(pages, start=1):
+        if page_no > 1:
+            can.showPage()
+        if L["name_field"]:
+            x, y, first_font, font, size, leading = L["name_field"]
+            can.setFont(first_font, size)
+            if name_lines:
+                can.drawString(x, y, name_lines[0])
+            can.setFont(font, size)
+            for i, line in enumerate(name_lines[1:], start=1):
+                if line:
+                    can.drawString(x, y - (i * leading), line)
+        current_font = None
+        for font, size, x, y, text in dates:
+            if (font, size) != current_font:
+                can.setFont(font, size)
+                current_font = (font, size)
+            can.drawString(x, y, text)
+
+        lead = ("BROUGHT FORWARD", format_paise(carried)) if page_no > 1 else None
+        carried += sum(amounts[start:end])
+        is_last = page_no == len(pages)
+        footer = ("TOTAL", total) if is_last else ("CARRIED FORWARD", format_paise(carried))
+        table_bottom_y = draw_table(can, L, rows[start:end], footer, lead)
+        if is_last and L["note_lines"]:
+            can.setFont(L["note_font"], L["note_size"])
+            text_x, text_y = L["left"], table_bottom_y - L["note_gap"]
+            for line in L["note_lines"]:
+                can.drawString(text_x, text_y, line)
+                text_y -= L["note_leading"]
+        if len(pages) > 1:
+            can.setFont(L["page_label_font"], L["page_label_size"])
+            can.drawRightString(L["right"], L["page_label_y"], f"Page {page_no} of {len(pages)}")
     can.save()
     buf.seek(0)
     return buf
 
+def _cached_template(template_path: str) -> Tuple[int, int, PdfReader, threading.Lock, str]:
+    """Returns the cache entry for a template, parsing it on first use or after its mtime/size changed."""
+    path = os.path.abspath(template_path)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Template file '{template_path}' not found") from None
+    cached = _TEMPLATE_CACHE.get(path)
+    if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+        return cached
+    with _TEMPLATE_CACHE_LOCK:
+        cached = _TEMPLATE_CACHE.get(path)
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            return cached
+        with open(path, "rb") as f:
+            raw = f.read()
+        entry = (st.st_mtime_ns, st.st_size, PdfReader(io.BytesIO(raw)), threading.Lock(), hashlib.sha256(raw).hexdigest())
+        _TEMPLATE_CACHE[path] = entry
+        return entry
+
+def load_template(template_path: str) -> Tuple[PdfReader, threading.Lock]:
+    """Returns the parsed template and the lock guarding it, parsing it only when the file changed."""
+    entry = _cached_template(template_path)
+    return entry[2], entry[3]
+
+def template_fingerprint(template_path: str) -> str:
+    """Returns the SHA-256 of the template's current contents."""
+    return _cached_template(template_path)[4]
+
+def layout_template(template_path: str, plan: Dict[str, Any]) -> str:
+    """The template a layout draws on: its own when the spec names one, else `template_path`."""
+    return plan["template"] or template_path
+
+def render_fingerprint(template_path: str, layout: str | None = None) -> str:
+    """Identifies everything besides the record data that affects the rendered PDF."""
+    plan = load_layout(layout)
+    return f"{OVERLAY_RENDERER}:{plan['fingerprint']}:{template_fingerprint(layout_template(template_path, plan))}"
+
 def fill_pdf_with_overlay(template_path: str, data: Dict[str, Any]) -> io.BytesIO:
-    """Merges a template PDF with a generated overlay PDF."""
-    if not os.path.exists(template_path):
-        raise FileNotFoundError(f"Template file '{template_path}' not found")
-    with open(template_path, "rb") as f:
-        base_pdf = PdfReader(f)
-        overlay_pdf = PdfReader(create_overlay_pdf(data))
+    """
+    Merges a template PDF with a generated overlay PDF, using the record's layout (whose
+    own template, if it names one, replaces `template_path`). Overlay page N goes onto
+    template page N, and the template's last page is repeated for any further pages.
+    """
+    plan = load_layout(data.get("layout"))
+    base_pdf, lock = load_template(layout_template(template_path, plan))
+    with phase("overlay"):
+        overlay_pdf = PdfReader(create_overlay_pdf(data, plan=plan))
+    with phase("merge"):
         writer = PdfWriter()
-        page = base_pdf.pages[0]
-        page.merge_page(overlay_pdf.pages[0])
-        writer.add_page(page)
+        # add_page clones the cached template page into the writer, so merging the overlay
+        # never touches the shared reader. The reader itself is not thread-safe.
+        with lock:
+            last_template_page = len(base_pdf.pages) - 1
+            pages = [writer.add_page(base_pdf.pages[min(i, last_template_page)]) for i in range(len(overlay_pdf.pages))]
+        for page, overlay_page in zip(pages, overlay_pdf.pages):
+            page.merge_page(overlay_page)
+            # merge_page leaves the merged content stream as a direct object; streams must be indirect.
+            page[NameObject("/Contents")] = writer._add_object(page["/Contents"])
+    with phase("serialize"):
         output = io.BytesIO()
         writer.write(output)
         output.seek(0)
-        return output
\ No newline at end of file
+    return output
@@ -0,0 +1,177 @@
+import hashlib
+import io
+from typing import Dict, Iterable, Iterator, List, Tuple
+from PyPDF2 import PdfReader
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject, StreamObject
+
+# Attributes a page may inherit from its ancestors in the page tree.
+_INHERITABLE = ("/Resources", "/MediaBox", "/CropBox", "/Rotate")
+_CATALOG_ID, _PAGES_ID = 1, 2
+
+class _ObjectEmitter:
+    """
+    Serializes the object graph of one source document with renumbered references.
+    Objects whose serialized bytes were already written for an earlier document
+    (template fonts, images, ...) reuse the earlier object number instead of being
+    written again.
+    """
+
+    def __init__(self, writer: "PdfStreamWriter"):
+        self.writer = writer
+        self.mapped: Dict[Tuple[int, int], int] = {}
+        self.in_progress: Dict[Tuple[int, int], int | None] = {}
+
+    def ref(self, ref: IndirectObject) -> int:
+        key = (ref.idnum, ref.generation)
+        if key in self.mapped:
+            return self.mapped[key]
+        if key in self.in_progress:
+            # Reference cycle: pin a number now and skip de-duplication for this object.
+            if self.in_progress[key] is None:
+                self.in_progress[key] = self.writer.allocate()
+            return self.in_progress[key]
+        self.in_progress[key] = None
+        body = self.serialize(ref.get_object())
+        pinned = self.in_progress.pop(key)
+        if pinned is None:
+            num = self.shared_object(body)
+        else:
+            num = pinned
+            self.writer.write_object(num, body)
+        self.mapped[key] = num
+        return num
+
+    def shared_object(self, body: bytes) -> int:
+        """Writes `body` as a new object unless identical bytes were written before."""
+        digest = hashlib.sha1(body).digest()
+        num = self.writer.shared.get(digest)
+        if num is None:
+            num = self.writer.allocate()
+            self.writer.shared[digest] = num
+            self.writer.write_object(num, body)
+        return num
+
+    def serialize(self, obj, extra: Dict[str, bytes] | None = None, skip: Tuple[str, ...] = ()) -> bytes:
+        out = io.BytesIO()
+        self._write(obj, out, extra, skip, top=True)
+        return out.getvalue()
+
+    def _write(self, obj, out, extra=None, skip=(), top=False) -> None:
+        if isinstance(obj, IndirectObject):
+            out.write(b"%d 0 R" % self.ref(obj))
+        elif isinstance(obj, StreamObject) and not top:
+            # Streams must be indirect; PyPDF2 leaves merged page contents as direct objects.
+            out.write(b"%d 0 R" % self.shared_object(self.serialize(obj)))
+        elif isinstance(obj, DictionaryObject):
+            is_stream = isinstance(obj, StreamObject)
+            out.write(b"<<")
+            for key, value in obj.items():
+                if key in skip or (extra and key in extra) or (is_stream and key == "/Length"):
+                    continue
+                NameObject(key).write_to_stream(out, None)
+                out.write(b" ")
+                self._write(value, out)
+                out.write(b"\n")
+            for key, raw in (extra or {}).items():
+                out.write(key.encode() + b" " + raw + b"\n")
+            if is_stream:
+                data = obj._data if isinstance(obj._data, bytes) else obj._data.encode("latin-1")
+                out.write(b"/Length %d\n>>\nstream\n" % len(data))
+                out.write(data)
+                out.write(b"\nendstream")
+            else:
+                out.write(b">>")
+        elif isinstance(obj, ArrayObject):
+            out.write(b"[")
+            for i, item in enumerate(obj):
+                if i:
+                    out.write(b" ")
+                self._write(item, out)
+            out.write(b"]")
+        else:
+            obj.write_to_stream(out, None)
+
+class PdfStreamWriter:
+    """
+    Writes a multi-page PDF incrementally. Pages are appended one source document at
+    a time and their bytes handed back immediately, so only the current document,
+    the xref offsets and the shared-object digests are held in memory.
+    """
+
+    def __init__(self):
+        self.position = 0
+        self.next_id = _PAGES_ID + 1
+        self.offsets: Dict[int, int] = {}
+        self.shared: Dict[bytes, int] = {}
+        self.kids: List[int] = []
+        self._chunks: List[bytes] = []
+
+    def allocate(self) -> int:
+        num = self.next_id
+        self.next_id += 1
+        return num
+
+    def write_object(self, num: int, body: bytes) -> None:
+        self.offsets[num] = self.position
+        self._emit(b"%d 0 obj\n" % num + body + b"\nendobj\n")
+
+    def _emit(self, chunk: bytes) -> None:
+        self._chunks.append(chunk)
+        self.position += len(chunk)
+
+    def _drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+    def header(self) -> bytes:
+        self._emit(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        return self._drain()
+
+    def add_document(self, pdf: bytes) -> bytes:
+        """Appends every page of `pdf` and returns the bytes produced for it."""
+        reader = PdfReader(io.BytesIO(pdf))
+        emitter = _ObjectEmitter(self)
+        for page in reader.pages:
+            extra = {"/Parent": b"%d 0 R" % _PAGES_ID}
+            for key in _INHERITABLE:
+                if key not in page:
+                    value = _inherited(page, key)
+                    if value is not None:
+                        extra[key] = emitter.serialize(value)
+            body = emitter.serialize(page, extra=extra, skip=("/Parent",))
+            num = self.allocate()
+            self.write_object(num, body)
+            self.kids.append(num)
+        return self._drain()
+
+    def trailer(self) -> bytes:
+        kids = b" ".join(b"%d 0 R" % k for k in self.kids)
+        self.write_object(_PAGES_ID, b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % len(self.kids))
+        self.write_object(_CATALOG_ID, b"<< /Type /Catalog /Pages %d 0 R >>" % _PAGES_ID)
+        xref_at = self.position
+        size = self.next_id
+        lines = [b"xref\n0 %d\n" % size, b"0000000000 65535 f \n"]
+        for num in range(1, size):
+            offset = self.offsets.get(num)
+            lines.append(b"%010d 00000 n \n" % offset if offset is not None else b"0000000000 65535 f \n")
+        self._emit(b"".join(lines))
+        self._emit(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, _CATALOG_ID, xref_at))
+        return self._drain()
+
+def _inherited(page: DictionaryObject, key: str):
+    node = page.get("/Parent")
+    while node is not None:
+        node = node.get_object()
+        if key in node:
+            return node[key]
+        node = node.get("/Parent")
+    return None
+
+def stream_merged_pdf(pdfs: Iterable[bytes]) -> Iterator[bytes]:
+    """Yields a single PDF containing the pages of every input PDF, one document at a time."""
+    writer = PdfStreamWriter()
+    yield writer.header()
+    for pdf in pdfs:
+        yield writer.add_document(pdf)
+    yield writer.trailer()
@@ -0,0 +1,338 @@
+"""
+Local SQLite stand-in for the Supabase client (DB_BACKEND=sqlite).
+
+Implements the part of the supabase-py query builder that db_manager uses
+(table().select/insert/upsert/update/delete with eq, in_, gt, gte, lt, lte, is_, ilike,
+contains, or_, order, limit, single, execute) and the report RPCs from supabase/migrations,
+so the app, the CLIs and the benchmarks can run without a Supabase project.
+"""
+import json
+import sqlite3
+import threading
+from typing import Any, Dict, List, Tuple
+from .charges import to_paise
+
+SCHEMA = """
+create table if not exists pdf_records (
+    id integer primary key autoincrement,
+    created_at text default current_timestamp,
+    name text,
+    date text,
+    from_date text,
+    to_date text,
+    charges text,
+    total real,
+    cf_charges text, cf_remarks text,
+    godown_rent text, godown_remarks text,
+    courier_charges text, courier_remarks text,
+    electric_bill text, electric_remarks text,
+    internet_charges text, internet_remarks text,
+    local_freight text, local_remarks text,
+    labour_charges text, labour_remarks text,
+    hamali_charges text, hamali_remarks text,
+    idempotency_key text unique,
+    version integer not null default 1,
+    layout text
+);
+create index if not exists pdf_records_name_idx on pdf_records (name collate nocase);
+create index if not exists pdf_records_date_idx on pdf_records (date, id);
+create index if not exists pdf_records_from_date_idx on pdf_records (from_date);
+create index if not exists pdf_records_to_date_idx on pdf_records (to_date);
+create index if not exists pdf_records_total_idx on pdf_records (total);
+"""
+
+# Columns stored as JSON text and decoded on read.
+JSON_COLUMNS = {"charges"}
+
+# Array columns that Postgres generates (see the search indexes migration), as SQLite JSON expressions.
+COMPUTED_ARRAYS = {
+    "charge_types": "(select json_group_array(distinct upper(trim(json_extract(ch.value, '$.type')))) "
+                    "from json_each(coalesce(charges, '[]')) ch)",
+}
+
+# Charge columns of the legacy schema and their labels, as in db_manager.convert_legacy_charges.
+LEGACY_CHARGES = (("C & F CHARGES", "cf_charges"), ("GODOWN RENT", "godown_rent"), ("COURIER CHARGES", "courier_charges"),
+                  ("ELECTRIC BILL", "electric_bill"), ("INTERNET CHARGES", "internet_charges"),
+                  ("LOCAL FREIGHT", "local_freight"), ("LABOUR CHARGES", "labour_charges"),
+                  ("HAMALI CHARGES", "hamali_charges"))
+
+_OPERATORS = {"eq": "=", "neq": "!=", "gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+
+# Every argument the RPC_SQL statements take; omitted ones are null, like SQL defaults.
+RPC_ARGS = ("p_from", "p_to", "p_q", "p_date_from", "p_date_to", "p_period_from", "p_period_to",
+            "p_total_min", "p_total_max", "p_charge_type")
+
+_RANGE = "(:p_from is null or r.date >= :p_from) and (:p_to is null or r.date <= :p_to)"
+
+# pdf_records_charge_lines(r) in Postgres, for use with json_each(... ) ch: the charges array of
+# record r, or its filled-in legacy columns (marked "legacy") when it has none.
+_CHARGES = "(case when json_type(r.charges) = 'array' then r.charges else '[]' end)"
+_CHARGE_LINES = (
+    f"(case when json_array_length({_CHARGES}) > 0 then {_CHARGES} else json_array("
+    + ", ".join(f"json_object('type', '{label}', 'amount', r.{column}, 'legacy', 1)" for label, column in LEGACY_CHARGES)
+    + ") end)"
+)
+_LINE_FILTER = ("(json_extract(ch.value, '$.legacy') is null "
+                "or coalesce(trim(json_extract(ch.value, '$.amount')), '') not in ('', 'None', 'null'))")
+# pdf_records_total(r) in exact paise: the stored total, else the sum of the charge lines.
+_ROW_TOTAL = (
+    "(case when r.total is not null then amount_paise(r.total) else "
+    f"(select coalesce(sum(amount_paise(json_extract(ch.value, '$.amount'))), 0) from json_each({_CHARGE_LINES}) ch "
+    f"where {_LINE_FILTER}) end)"
+)
+
+RPC_SQL = {
+    "pdf_records_grand_total": f"""
+        select coalesce(sum({_ROW_TOTAL}), 0) / 100.0
+        from pdf_records r
+        where (:p_q is null or r.name like '%' || :p_q || '%')
+          and (:p_date_from is null or r.date >= :p_date_from)
+          and (:p_date_to is null or r.date <= :p_date_to)
+          and (:p_period_from is null or r.to_date >= :p_period_from)
+          and (:p_period_to is null or r.from_date <= :p_period_to)
+          and (:p_total_min is null or r.total >= cast(:p_total_min as real))
+          and (:p_total_max is null or r.total <= cast(:p_total_max as real))
+          and (:p_charge_type is null or exists (select 1 from json_each({_CHARGES}) ch
+                                                 where upper(trim(json_extract(ch.value, '$.type'))) = upper(trim(:p_charge_type))))""",
+    "pdf_records_totals_by_month": f"""
+        select substr(r.date, 1, 7) as bucket, count(*) as invoices, coalesce(sum({_ROW_TOTAL}), 0) / 100.0 as total
+        from pdf_records r where {_RANGE} group by 1 order by 1""",
+    "pdf_records_totals_by_customer": f"""
+        select trim(case when instr(r.name, char(10)) > 0 then substr(r.name, 1, instr(r.name, char(10)) - 1) else r.name end) as bucket,
+               count(*) as invoices, coalesce(sum({_ROW_TOTAL}), 0) / 100.0 as total
+        from pdf_records r where {_RANGE} group by 1 order by 3 desc""",
+    "pdf_records_totals_by_charge_type": f"""
+        select upper(trim(json_extract(ch.value, '$.type'))) as bucket, count(distinct r.id) as invoices,
+               coalesce(sum(amount_paise(json_extract(ch.value, '$.amount'))), 0) / 100.0 as total
+        from pdf_records r, json_each({_CHARGE_LINES}) ch
+        where {_RANGE} and {_LINE_FILTER} group by 1 order by 3 desc""",
+}
+
+class SqliteResponse:
+    def __init__(self, data: Any, count: int | None = None):
+        self.data = data
+        self.count = count
+
+class SqliteQuery:
+    """One table query, built up with the same chained calls as the postgrest builder."""
+
+    def __init__(self, client: "SqliteClient", table: str):
+        self.client = client
+        self.table = table
+        self.op = "select"
+        self.columns = "*"
+        self.count: str | None = None
+        self.payload: Any = None
+        self.where: List[str] = []
+        self.params: List[Any] = []
+        self.order_by: List[str] = []
+        self.row_limit: int | None = None
+        self.single_row = False
+        self.conflict: Tuple[str, bool] | None = None
+
+    def select(self, columns: str = "*", count: str | None = None) -> "SqliteQuery":
+        self.columns, self.count = columns, count
+        return self
+
+    def insert(self, payload) -> "SqliteQuery":
+        self.op, self.payload = "insert", payload
+        return self
+
+    def upsert(self, payload, on_conflict: str = "id", ignore_duplicates: bool = False) -> "SqliteQuery":
+        self.op, self.payload = "insert", payload
+        self.conflict = (_identifier(on_conflict), ignore_duplicates)
+        return self
+
+    def update(self, payload: Dict[str, Any]) -> "SqliteQuery":
+        self.op, self.payload = "update", payload
+        return self
+
+    def delete(self) -> "SqliteQuery":
+        self.op = "delete"
+        return self
+
+    def _condition(self, column: str, op: str, value: Any) -> Tuple[str, List[Any]]:
+        column = _identifier(column)
+        if op == "is":
+            return f"{column} is null" if str(value).lower() == "null" else f"{column} is not null", []
+        if op == "in":
+            values = list(value)
+            return (f"{column} in ({', '.join('?' * len(values))})" if values else "0"), values
+        if op == "ilike":
+            return f"{column} like ?", [value]
+        if op == "cs":
+            array = COMPUTED_ARRAYS.get(column, column)
+            values = list(value)
+            return " and ".join([f"exists (select 1 from json_each({array}) where value = ?)"] * len(values)) or "1", values
+        return f"{column} {_OPERATORS[op]} ?", [_encode(column, value)]
+
+    def _filter(self, column: str, op: str, value: Any) -> "SqliteQuery":
+        sql, params = self._condition(column, op, value)
+        self.where.append(sql)
+        self.params.extend(params)
+        return self
+
+    def eq(self, column, value): return self._filter(column, "eq", value)
+    def neq(self, column, value): return self._filter(column, "neq", value)
+    def gt(self, column, value): return self._filter(column, "gt", value)
+    def gte(self, column, value): return self._filter(column, "gte", value)
+    def lt(self, column, value): return self._filter(column, "lt", value)
+    def lte(self, column, value): return self._filter(column, "lte", value)
+    def in_(self, column, values): return self._filter(column, "in", values)
+    def is_(self, column, value): return self._filter(column, "is", value)
+    def ilike(self, column, pattern): return self._filter(column, "ilike", pattern)
+    def contains(self, column, values): return self._filter(column, "cs", values)
+
+    def or_(self, filters: str) -> "SqliteQuery":
+        """PostgREST `or` filter string, e.g. "charges.is.null,total.is.null"."""
+        parts, params = [], []
+        for item in filters.split(","):
+            column, op, value = item.split(".", 2)
+            sql, values = self._condition(column, op, value)
+            parts.append(sql)
+            params.extend(values)
+        self.where.append(f"({' or '.join(parts)})")
+        self.params.extend(params)
+        return self
+
+    def order(self, column: str, desc: bool = False) -> "SqliteQuery":
+        self.order_by.append(f"{_identifier(column)} {'desc' if desc else 'asc'}")
+        return self
+
+    def limit(self, n: int) -> "SqliteQuery":
+        self.row_limit = int(n)
+        return self
+
+    def single(self) -> "SqliteQuery":
+        self.single_row = True
+        return self
+
+    def _where_sql(self) -> str:
+        return f" where {' and '.join(self.where)}" if self.where else ""
+
+    def execute(self) -> SqliteResponse:
+        with self.client.lock:
+            conn = self.client.conn
+            if self.op == "insert":
+                rows = self.payload if isinstance(self.payload, list) else [self.payload]
+                ids = []
+                with conn:
+                    for row in rows:
+                        columns = [_identifier(c) for c in row]
+                        sql = f"insert into {self.table} ({', '.join(columns)}) values ({', '.join('?' * len(columns))})"
+                        if self.conflict:
+                            target, ignore = self.conflict
+                            updates = ", ".join(f"{c} = excluded.{c}" for c in columns if c != target)
+                            sql += f" on conflict ({target}) " + ("do nothing" if ignore or not updates else f"do update set {updates}")
+                        inserted = conn.execute(sql + " returning id", [_encode(c, v) for c, v in row.items()]).fetchone()
+                        if inserted is not None:
+                            ids.append(inserted[0])
+                return SqliteResponse(self._rows_by_id(ids))
+            if self.op in ("update", "delete"):
+                ids = [r[0] for r in conn.execute(f"select id from {self.table}{self._where_sql()}", self.params)]
+                before = self._rows_by_id(ids) if self.op == "delete" else None
+                with conn:
+                    if self.op == "update":
+                        assignments = ", ".join(f"{_identifier(c)} = ?" for c in self.payload)
+                        conn.execute(
+                            f"update {self.table} set {assignments}{self._where_sql()}",
+                            [_encode(c, v) for c, v in self.payload.items()] + self.params,
+                        )
+                    else:
+                        conn.execute(f"delete from {self.table}{self._where_sql()}", self.params)
+                return SqliteResponse(before if before is not None else self._rows_by_id(ids))
+
+            columns = "*" if self.columns.strip() == "*" else ", ".join(_identifier(c) for c in self.columns.split(","))
+            sql = f"select {columns} from {self.table}{self._where_sql()}"
+            if self.order_by:
+                sql += f" order by {', '.join(self.order_by)}"
+            if self.row_limit is not None:
+                sql += f" limit {self.row_limit}"
+            rows = [_decode(r) for r in conn.execute(sql, self.params)]
+            count = None
+            if self.count:
+                count = conn.execute(f"select count(*) from {self.table}{self._where_sql()}", self.params).fetchone()[0]
+        if self.single_row:
+            return SqliteResponse(rows[0] if rows else None)
+        return SqliteResponse(rows, count)
+
+    def _rows_by_id(self, ids: List[int]) -> List[Dict[str, Any]]:
+        if not ids:
+            return []
+        cur = self.client.conn.execute(f"select * from {self.table} where id in ({', '.join('?' * len(ids))}) order by id", ids)
+        return [_decode(r) for r in cur]
+
+def _records_patch(conn: sqlite3.Connection, params: Dict[str, Any]) -> int | None:
+    """Python version of the pdf_records_patch SQL function."""
+    row = conn.execute("select * from pdf_records where id = ? and version = ?", (params["p_id"], params["p_version"])).fetchone()
+    if row is None:
+        return None
+    fields = dict(params.get("p_fields") or {})
+    if params.get("p_charges_length") is not None:
+        stored = json.loads(row["charges"] or "[]")
+        replaced = params.get("p_charges_set") or {}
+        fields["charges"] = [
+            replaced.get(str(i), stored[i] if i < len(stored) else None) for i in range(params["p_charges_length"])
+        ]
+    fields["version"] = params["p_version"] + 1
+    assignments = ", ".join(f"{_identifier(c)} = ?" for c in fields)
+    conn.execute(f"update pdf_records set {assignments} where id = ?", [_encode(c, v) for c, v in fields.items()] + [params["p_id"]])
+    return fields["version"]
+
+# Functions that are plpgsql in Postgres, run against the connection inside a transaction.
+RPC_FUNCTIONS = {"pdf_records_patch": _records_patch}
+
+class SqliteRpc:
+    def __init__(self, client: "SqliteClient", name: str, params: Dict[str, Any]):
+        self.client, self.name, self.params = client, name, params
+
+    def execute(self) -> SqliteResponse:
+        if self.name in RPC_FUNCTIONS:
+            with self.client.lock, self.client.conn:
+                return SqliteResponse(RPC_FUNCTIONS[self.name](self.client.conn, self.params))
+        sql = RPC_SQL[self.name]
+        params = {**dict.fromkeys(RPC_ARGS), **self.params}
+        with self.client.lock:
+            cur = self.client.conn.execute(sql, params)
+            rows = [dict(r) for r in cur]
+        if self.name == "pdf_records_grand_total":
+            return SqliteResponse(next(iter(rows[0].values())) if rows else 0)
+        return SqliteResponse(rows)
+
+class SqliteClient:
+    """Supabase-compatible client over one SQLite file (or ":memory:"), shared across threads."""
+
+    def __init__(self, path: str = ":memory:"):
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        # pdf_records_amount() in Postgres: an amount in exact paise, unparseable amounts as 0.
+        self.conn.create_function("amount_paise", 1, to_paise, deterministic=True)
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+
+    def table(self, name: str) -> SqliteQuery:
+        return SqliteQuery(self, _identifier(name))
+
+    def rpc(self, name: str, params: Dict[str, Any] | None = None) -> SqliteRpc:
+        if name not in RPC_SQL and name not in RPC_FUNCTIONS:
+            raise ValueError(f"Unknown function '{name}'")
+        return SqliteRpc(self, name, params or {})
+
+def _identifier(name: str) -> str:
+    name = name.strip()
+    if not name.replace("_", "").isalnum():
+        raise ValueError(f"Invalid identifier '{name}'")
+    return name
+
+def _encode(column: str, value: Any) -> Any:
+    if column in JSON_COLUMNS and value is not None and not isinstance(value, str):
+        return json.dumps(value)
+    return value
+
+def _decode(row: sqlite3.Row) -> Dict[str, Any]:
+    data = dict(row)
+    for column in JSON_COLUMNS & data.keys():
+        if isinstance(data[column], str):
+            data[column] = json.loads(data[column])
+    return data
@@ -0,0 +1,207 @@
+"""
+Offline benchmarks for the invoice render and data paths.
+
+    python -m benchmarks.run                            # all cases, batches of 1/100/10000
+    python -m benchmarks.run --quick                    # batches of 1/100 only
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --baseline results.json --tolerance 0.15
+
+Supabase is replaced by an in-memory SqliteClient (api.sqlite_backend), records are synthetic and seeded,
+and each batch size runs in its own subprocess so its peak RSS is measured in isolation
+(the parent's peak plus the largest render worker's, since rendering runs on a process pool).
+With --baseline the run exits non-zero when a tracked metric regresses past the tolerance.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from api.db_manager import charge_columns, fetch_many, migrate_row_to_charges_if_needed, row_to_pdf_record  # noqa: E402
+from api.helpers import compute_total_from_charges, normalize_charges_from_request  # noqa: E402
+from api.sqlite_backend import SqliteClient  # noqa: E402
+
+TEMPLATE_PATH = os.path.join(ROOT, "template.pdf")
+CHARGE_TYPES = ["C & F CHARGES", "GODOWN RENT", "COURIER CHARGES", "ELECTRIC BILL",
+                "INTERNET CHARGES", "LOCAL FREIGHT", "LABOUR CHARGES", "HAMALI CHARGES"]
+LEGACY_COLUMNS = ["cf_charges", "godown_rent", "courier_charges", "electric_bill",
+                  "internet_charges", "local_freight", "labour_charges", "hamali_charges"]
+
+# metric name -> True if higher is better; only these are compared against a baseline
+TRACKED = {"p50_ms": False, "invoices_per_s": True, "peak_rss_mb": False}
+
+def synthetic_record(rng: random.Random, i: int, max_charges: int = 12) -> Dict[str, Any]:
+    charges = [
+        {"type": rng.choice(CHARGE_TYPES), "amount": round(rng.uniform(10, 50000), 2), "remark": rng.choice(["", "paid", f"ref {i}"])}
+        for _ in range(rng.randint(1, max_charges))
+    ]
+    return {
+        "name": f"Customer {i}\n{rng.randint(1, 999)} Market Road\nAkola",
+        "date": f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "from_date": "2025-01-01",
+        "to_date": "2025-01-31",
+        "charges": charges,
+        "total": round(sum(c["amount"] for c in charges), 2),
+    }
+
+def legacy_row(rng: random.Random, i: int) -> Dict[str, Any]:
+    row = {"id": i, "name": f"Legacy {i}", "date": "2024-03-01", "charges": None, "total": None}
+    for col in LEGACY_COLUMNS:
+        row[col] = str(round(rng.uniform(0, 5000), 2)) if rng.random() < 0.6 else None
+    return row
+
+def totals_by_dicts(rows: List[Dict[str, Any]]) -> List[float]:
+    """Per-invoice totals, one charges list at a time."""
+    return [compute_total_from_charges(migrate_row_to_charges_if_needed(r)) for r in rows]
+
+def totals_by_columns(rows: List[Dict[str, Any]]) -> List[int]:
+    """The same totals over ChargeColumns, in exact paise."""
+    return charge_columns(rows).totals()
+
+def time_calls(fn: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    fn()  # warm-up (template parse, font loading)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "p50_ms": round(statistics.median(samples), 4),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 4),
+        "mean_ms": round(statistics.fmean(samples), 4),
+        "repeat": repeat,
+    }
+
+def micro_cases(repeat: int) -> Dict[str, Dict[str, float]]:
+    from werkzeug.datastructures import MultiDict
+    from api.pdf_generator import create_overlay_pdf, fill_pdf_with_overlay
+
+    rng = random.Random(1)
+    small, large = synthetic_record(rng, 1, 8), synthetic_record(rng, 2, 18)
+    form = MultiDict()
+    for ch in large["charges"] + [{"type": "", "amount": "", "remark": ""}] * 4:
+        form.add("charge_type[]", ch["type"])
+        form.add("charge_amount[]", str(ch["amount"]))
+        form.add("charge_remark[]", ch["remark"])
+    legacy = legacy_row(rng, 3)
+    total_rows = [synthetic_record(rng, i) for i in range(5000)]
+    return {
+        "overlay_fast": time_calls(lambda: create_overlay_pdf(small, "fast"), repeat),
+        "overlay_table": time_calls(lambda: create_overlay_pdf(small, "table"), repeat),
+        "fill_pdf_single": time_calls(lambda: fill_pdf_with_overlay(TEMPLATE_PATH, small), repeat),
+        "fill_pdf_many_charges": time_calls(lambda: fill_pdf_with_overlay(TEMPLATE_PATH, large), repeat),
+        "normalize_charges_from_request": time_calls(lambda: normalize_charges_from_request(form), repeat * 20),
+        "migrate_row_legacy": time_calls(lambda: migrate_row_to_charges_if_needed(legacy), repeat * 20),
+        "row_to_pdf_record_legacy": time_calls(lambda: row_to_pdf_record(legacy), repeat * 20),
+        "totals_dicts_5000": time_calls(lambda: totals_by_dicts(total_rows), repeat),
+        "totals_columns_5000": time_calls(lambda: totals_by_columns(total_rows), repeat),
+    }
+
+def batch_case(size: int, workers: int) -> Dict[str, float]:
+    """Fetch `size` records from an in-memory SQLite DB, render them and stream one merged PDF to a byte counter."""
+    from api.batch import render_pdfs
+    from api.pdf_stream import stream_merged_pdf
+
+    rng = random.Random(size)
+    supabase = SqliteClient(":memory:")
+    supabase.table("pdf_records").insert([synthetic_record(rng, i) for i in range(size)]).execute()
+    start = time.perf_counter()
+    rows = fetch_many(supabase, date_from="2025-01-01")
+    pdfs = render_pdfs(TEMPLATE_PATH, (row_to_pdf_record(r) for r in rows), workers=workers)
+    out_bytes = sum(len(chunk) for chunk in stream_merged_pdf(pdfs))
+    elapsed = time.perf_counter() - start
+    # The pool has been shut down by now, so RUSAGE_CHILDREN covers every render worker.
+    parent_mb, worker_mb = _maxrss_mb(resource.RUSAGE_SELF), _maxrss_mb(resource.RUSAGE_CHILDREN)
+    return {
+        "invoices": len(rows),
+        "seconds": round(elapsed, 3),
+        "invoices_per_s": round(len(rows) / elapsed, 2),
+        "output_mb": round(out_bytes / (1024 * 1024), 2),
+        # parent plus the largest render worker
+        "peak_rss_mb": round(parent_mb + worker_mb, 1),
+        "peak_rss_parent_mb": round(parent_mb, 1),
+        "peak_rss_worker_mb": round(worker_mb, 1),
+        "workers": workers,
+    }
+
+def _maxrss_mb(who: int) -> float:
+    maxrss = resource.getrusage(who).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == "darwin" else maxrss / 1024
+
+def run_batch_subprocess(size: int, workers: int) -> Dict[str, float]:
+    out = subprocess.run(
+        [sys.executable, "-m", "benchmarks.run", "--batch-child", str(size), "--workers", str(workers)],
+        cwd=ROOT, check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Returns a description of every tracked metric that is worse than baseline by more than `tolerance`."""
+    regressions = []
+    for case, metrics in results["cases"].items():
+        base = baseline.get("cases", {}).get(case)
+        if not base:
+            continue
+        for metric, higher_is_better in TRACKED.items():
+            if metric not in metrics or not base.get(metric):
+                continue
+            change = (metrics[metric] - base[metric]) / base[metric]
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f"{case}.{metric}: {base[metric]} -> {metrics[metric]} ({change:+.1%})")
+    return regressions
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark invoice rendering and data paths offline.")
+    parser.add_argument("--sizes", default="1,100,10000", help="comma separated batch sizes")
+    parser.add_argument("--quick", action="store_true", help="shorthand for --sizes 1,100 --repeat 20")
+    parser.add_argument("--repeat", type=int, default=50, help="iterations per micro benchmark")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--output", help="write JSON results to this file")
+    parser.add_argument("--baseline", help="compare against a previous --output file")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative regression")
+    parser.add_argument("--batch-child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.batch_child is not None:
+        print(json.dumps(batch_case(args.batch_child, args.workers)))
+        return 0
+    if args.quick:
+        args.sizes, args.repeat = "1,100", 20
+
+    results: Dict[str, Any] = {
+        "meta": {
+            "python": platform.python_version(), "platform": platform.platform(),
+            "cpus": os.cpu_count(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "cases": micro_cases(args.repeat),
+    }
+    for size in (int(s) for s in args.sizes.split(",") if s):
+        results["cases"][f"batch_{size}"] = run_batch_subprocess(size, args.workers)
+
+    for case, metrics in results["cases"].items():
+        print(f"{case:32} " + "  ".join(f"{k}={v}" for k, v in metrics.items()))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"❌ regression {line}")
+        if regressions:
+            return 1
+        print("✅ no regressions against baseline")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
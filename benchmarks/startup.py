@@ -0,0 +1,82 @@
+"""
+Cold-start import report for the serverless entry point.
+
+    python -m benchmarks.startup                      # summary of `python -X importtime -c "import api.index"`
+    python -m benchmarks.startup --max-ms 300 --repeat 5
+
+Each run imports api.index in a fresh interpreter and parses the -X importtime output.
+Exits non-zero when the median import time exceeds --max-ms, or when a module listed in
+--forbid (the PDF and database stacks, which routes import on first use) is loaded at startup.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DEFAULT_FORBID = "supabase,postgrest,httpx,reportlab,PyPDF2"
+
+def import_times(module: str) -> List[Tuple[str, int, int]]:
+    """Returns (module, self µs, cumulative µs) for every import made by `import <module>` in a new interpreter."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    entries = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        entries.append((name.strip(), int(self_us), int(cumulative_us)))
+    return entries
+
+def summarize(entries: List[Tuple[str, int, int]], module: str, top: int) -> Dict[str, object]:
+    total = next(cum for name, _, cum in reversed(entries) if name == module)
+    roots: Dict[str, int] = {}
+    for name, self_us, _ in entries:
+        root = name.split(".")[0]
+        roots[root] = roots.get(root, 0) + self_us
+    return {
+        "total_ms": round(total / 1000, 1),
+        "modules": sorted({name.split(".")[0] for name, _, _ in entries}),
+        "by_package_ms": {k: round(v / 1000, 1) for k, v in sorted(roots.items(), key=lambda kv: -kv[1])[:top]},
+    }
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Report and check the import time of the app entry point.")
+    parser.add_argument("--module", default="api.index")
+    parser.add_argument("--repeat", type=int, default=3, help="fresh interpreters to run; the median is reported")
+    parser.add_argument("--top", type=int, default=10, help="packages to list")
+    parser.add_argument("--max-ms", type=float, default=400.0, help="fail above this median import time")
+    parser.add_argument("--forbid", default=DEFAULT_FORBID, help="comma separated packages that must not load at import")
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args(argv)
+
+    runs = [summarize(import_times(args.module), args.module, args.top) for _ in range(max(args.repeat, 1))]
+    report = min(runs, key=lambda r: abs(r["total_ms"] - statistics.median(x["total_ms"] for x in runs)))
+    report["median_ms"] = statistics.median(r["total_ms"] for r in runs)
+    forbidden = [m for m in args.forbid.split(",") if m and m in report["modules"]]
+
+    print(f"import {args.module}: median {report['median_ms']} ms over {len(runs)} runs")
+    for package, ms in report["by_package_ms"].items():
+        print(f"  {package:24} {ms:8.1f} ms")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    failed = False
+    if report["median_ms"] > args.max_ms:
+        print(f"❌ import time {report['median_ms']} ms exceeds {args.max_ms} ms")
+        failed = True
+    for module in forbidden:
+        print(f"❌ {module} is imported at startup; import it inside the code that needs it")
+        failed = True
+    if not failed:
+        print("✅ startup within budget")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
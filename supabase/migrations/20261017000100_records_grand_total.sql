@@ -0,0 +1,81 @@
+-- Grand total for the /records page, computed in the database instead of
+-- transferring every row. It follows the page's search filters (the ones
+-- db_manager.apply_search adds to the listing query); with no arguments it is the
+-- total over every record. Rows without a stored total (legacy schema) count the
+-- sum of their charge lines, with each amount rounded to paise and unparseable
+-- amounts counted as 0, as the application does. The report functions of the next
+-- migration use the same per-row total and charge lines.
+
+create or replace function public.pdf_records_amount(value text)
+returns numeric
+language sql
+immutable
+as $$
+  select case when btrim(value) ~ '^[-+]?([0-9]+\.?[0-9]*|\.[0-9]+)([eE][-+]?[0-9]+)?$'
+              then round(btrim(value)::numeric, 2)
+              else 0 end;
+$$;
+
+-- The charge lines of a record: its charges array, or for a legacy row without one
+-- the old per-charge amount columns that are filled in (as db_manager.convert_legacy_charges).
+create or replace function public.pdf_records_charge_lines(r public.pdf_records)
+returns table (charge_type text, amount numeric)
+language sql
+stable
+as $$
+  with c as (
+    select case when jsonb_typeof(r.charges::jsonb) = 'array' then r.charges::jsonb else '[]'::jsonb end as charges
+  )
+  select ch->>'type', public.pdf_records_amount(ch->>'amount')
+  from c cross join lateral jsonb_array_elements(c.charges) ch
+  union all
+  select l.label, public.pdf_records_amount(l.value)
+  from c cross join lateral (values
+    ('C & F CHARGES', r.cf_charges::text), ('GODOWN RENT', r.godown_rent::text),
+    ('COURIER CHARGES', r.courier_charges::text), ('ELECTRIC BILL', r.electric_bill::text),
+    ('INTERNET CHARGES', r.internet_charges::text), ('LOCAL FREIGHT', r.local_freight::text),
+    ('LABOUR CHARGES', r.labour_charges::text), ('HAMALI CHARGES', r.hamali_charges::text)
+  ) l(label, value)
+  where jsonb_array_length(c.charges) = 0
+    and coalesce(btrim(l.value), '') not in ('', 'None', 'null');
+$$;
+
+-- The stored total, else the sum of the charge lines. Every report sums this per row.
+create or replace function public.pdf_records_total(r public.pdf_records)
+returns numeric
+language sql
+stable
+as $$
+  select coalesce(r.total::numeric, (select coalesce(sum(l.amount), 0) from public.pdf_records_charge_lines(r) l));
+$$;
+
+create or replace function public.pdf_records_grand_total(
+  p_q text default null,
+  p_date_from date default null,
+  p_date_to date default null,
+  p_period_from date default null,
+  p_period_to date default null,
+  p_total_min numeric default null,
+  p_total_max numeric default null,
+  p_charge_type text default null
+)
+returns numeric
+language sql
+stable
+as $$
+  select coalesce(sum(public.pdf_records_total(r)), 0)
+  from public.pdf_records r
+  where (p_q is null or r.name ilike '%' || p_q || '%')
+    and (p_date_from is null or r.date::date >= p_date_from)
+    and (p_date_to is null or r.date::date <= p_date_to)
+    and (p_period_from is null or r.to_date::date >= p_period_from)
+    and (p_period_to is null or r.from_date::date <= p_period_to)
+    and (p_total_min is null or r.total::numeric >= p_total_min)
+    and (p_total_max is null or r.total::numeric <= p_total_max)
+    and (p_charge_type is null or exists (
+      select 1 from jsonb_array_elements(
+        case when jsonb_typeof(r.charges::jsonb) = 'array' then r.charges::jsonb else '[]'::jsonb end
+      ) ch
+      where upper(btrim(ch->>'type')) = upper(btrim(p_charge_type))
+    ));
+$$;
@@ -0,0 +1,44 @@
+-- Aggregate reports over an optional invoice date range. Each function returns
+-- one row per bucket so the API never has to transfer the invoices themselves.
+-- Invoices count with the same per-row total as the grand total (legacy rows
+-- included), and charge types sum the rounded charge lines, legacy columns included.
+
+create or replace function public.pdf_records_totals_by_month(p_from date default null, p_to date default null)
+returns table (bucket text, invoices bigint, total numeric)
+language sql
+stable
+as $$
+  select to_char(r.date::date, 'YYYY-MM'), count(*), coalesce(sum(public.pdf_records_total(r)), 0)
+  from public.pdf_records r
+  where (p_from is null or r.date::date >= p_from)
+    and (p_to is null or r.date::date <= p_to)
+  group by 1
+  order by 1;
+$$;
+
+create or replace function public.pdf_records_totals_by_customer(p_from date default null, p_to date default null)
+returns table (bucket text, invoices bigint, total numeric)
+language sql
+stable
+as $$
+  select btrim(split_part(r.name, E'\n', 1)), count(*), coalesce(sum(public.pdf_records_total(r)), 0)
+  from public.pdf_records r
+  where (p_from is null or r.date::date >= p_from)
+    and (p_to is null or r.date::date <= p_to)
+  group by 1
+  order by 3 desc;
+$$;
+
+create or replace function public.pdf_records_totals_by_charge_type(p_from date default null, p_to date default null)
+returns table (bucket text, invoices bigint, total numeric)
+language sql
+stable
+as $$
+  select upper(btrim(l.charge_type)), count(distinct r.id), coalesce(sum(l.amount), 0)
+  from public.pdf_records r
+  cross join lateral public.pdf_records_charge_lines(r) l
+  where (p_from is null or r.date::date >= p_from)
+    and (p_to is null or r.date::date <= p_to)
+  group by 1
+  order by 3 desc;
+$$;
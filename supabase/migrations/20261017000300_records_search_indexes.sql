@@ -0,0 +1,34 @@
+-- Indexes behind the /records search filters.
+--   name        ilike '%...%'  -> trigram GIN
+--   date, from_date/to_date, total ranges -> btree (with id for the keyset order)
+--   charge type -> GIN over a generated array of the normalized charge types,
+--                  queried with `cs` (@>) so PostgREST can push it down.
+
+create extension if not exists pg_trgm;
+
+create index if not exists pdf_records_name_trgm_idx
+  on public.pdf_records using gin (name gin_trgm_ops);
+
+create index if not exists pdf_records_date_idx on public.pdf_records (date, id);
+create index if not exists pdf_records_from_date_idx on public.pdf_records (from_date);
+create index if not exists pdf_records_to_date_idx on public.pdf_records (to_date);
+create index if not exists pdf_records_total_idx on public.pdf_records (total);
+
+create or replace function public.pdf_charge_types(p_charges jsonb)
+returns text[]
+language sql
+immutable
+as $$
+  select coalesce(array_agg(distinct upper(btrim(ch->>'type'))), '{}')
+  from jsonb_array_elements(
+    case when jsonb_typeof(p_charges) = 'array' then p_charges else '[]'::jsonb end
+  ) ch
+  where btrim(coalesce(ch->>'type', '')) <> '';
+$$;
+
+alter table public.pdf_records
+  add column if not exists charge_types text[]
+  generated always as (public.pdf_charge_types(charges::jsonb)) stored;
+
+create index if not exists pdf_records_charge_types_idx
+  on public.pdf_records using gin (charge_types);
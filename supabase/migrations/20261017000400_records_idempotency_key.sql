@@ -0,0 +1,8 @@
+-- Idempotent inserts from /generate: each submission carries a key, and a
+-- repeated submission (double click, retry, outbox replay) upserts onto the
+-- row it already created. Rows from before this migration keep a null key.
+
+alter table public.pdf_records add column if not exists idempotency_key text;
+
+create unique index if not exists pdf_records_idempotency_key_idx
+  on public.pdf_records (idempotency_key);
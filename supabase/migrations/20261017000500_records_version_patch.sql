@@ -0,0 +1,46 @@
+-- Optimistic concurrency and partial updates for /update.
+-- Every edit is applied by pdf_records_patch, which only writes when the row is
+-- still at the version the editor loaded, bumps the version, and receives just
+-- the changed columns plus the changed charge entries (by index) rather than
+-- the whole charges array. The per-record layout (layouts/<name>.json; null means
+-- the deployment's DEFAULT_LAYOUT) is one of the columns an edit can change.
+
+alter table public.pdf_records add column if not exists version integer not null default 1;
+alter table public.pdf_records add column if not exists layout text;
+
+create or replace function public.pdf_records_patch(
+  p_id bigint,
+  p_version integer,
+  p_fields jsonb default '{}'::jsonb,
+  p_charges_length integer default null,
+  p_charges_set jsonb default '{}'::jsonb
+)
+returns integer  -- the new version, or null when the row is gone or was changed by someone else
+language plpgsql
+as $$
+declare
+  v_row public.pdf_records;
+  v_fields jsonb := coalesce(p_fields, '{}'::jsonb);
+begin
+  select * into v_row from public.pdf_records where id = p_id and version = p_version for update;
+  if not found then
+    return null;
+  end if;
+
+  -- Rebuild the array from the stored entries, replacing the indexes that changed.
+  if p_charges_length is not null then
+    v_fields := v_fields || jsonb_build_object('charges', (
+      select coalesce(jsonb_agg(coalesce(p_charges_set -> i::text, v_row.charges::jsonb -> i) order by i), '[]'::jsonb)
+      from generate_series(0, p_charges_length - 1) i
+    ));
+  end if;
+
+  -- jsonb_populate_record converts each value to the column's own type.
+  v_row := jsonb_populate_record(v_row, v_fields || jsonb_build_object('version', p_version + 1));
+  update public.pdf_records
+     set name = v_row.name, date = v_row.date, from_date = v_row.from_date, to_date = v_row.to_date,
+         charges = v_row.charges, total = v_row.total, layout = v_row.layout, version = v_row.version
+   where id = p_id;
+  return v_row.version;
+end;
+$$;
@@ -0,0 +1,23 @@
+from api import backfill
+from api.sqlite_backend import SqliteClient
+
+def test_backfill_skips_rows_edited_after_they_were_read(monkeypatch):
+    db = SqliteClient(":memory:")
+    db.table("pdf_records").insert([
+        {"name": "Untouched", "cf_charges": "10.5"},
+        {"name": "Edited", "cf_charges": "20"},
+    ]).execute()
+    fetch = backfill.fetch_rows_needing_migration
+
+    def fetch_then_edit(supabase, after_id=0, limit=500):
+        rows = fetch(supabase, after_id=after_id, limit=limit)
+        if rows:  # a clerk saves record 2 between the read and the backfill's write
+            supabase.table("pdf_records").update({"charges": [{"type": "NEW", "amount": 5}], "total": 5, "version": 2}).eq("id", 2).execute()
+        return rows
+
+    monkeypatch.setattr(backfill, "fetch_rows_needing_migration", fetch_then_edit)
+    assert backfill.run_backfill(db, checkpoint=None) == (1, 1)
+    rows = {r["id"]: r for r in db.table("pdf_records").select("*").execute().data}
+    assert rows[1]["charges"] == [{"type": "C & F CHARGES", "amount": 10.5, "remark": ""}]
+    assert (rows[1]["total"], rows[1]["version"]) == (10.5, 2)
+    assert rows[2]["charges"] == [{"type": "NEW", "amount": 5}] and rows[2]["total"] == 5
@@ -0,0 +1,14 @@
+from api import batch
+
+def test_shared_pool_is_created_once_and_spawns(monkeypatch):
+    monkeypatch.setenv("EXPORT_WORKERS", "2")
+    monkeypatch.setattr(batch, "_pool", None)
+    monkeypatch.setattr(batch, "_pool_workers", 0)
+    pool, workers = batch.get_pool()
+    try:
+        assert workers == 2
+        assert batch.get_pool() == (pool, 2)
+        # Forked children could inherit locks held by request threads (see _make_pool).
+        assert pool._mp_context.get_start_method() == "spawn"
+    finally:
+        pool.shutdown()
@@ -0,0 +1,29 @@
+import pytest
+from api.charges import format_paise, to_paise
+from api.helpers import compute_total_from_charges
+from api.importer import normalize_row
+from api.pdf_generator import _charge_rows
+
+@pytest.mark.parametrize("value, paise", [
+    ("12.34", 1234), (0.1, 10), ("1.005", 101), (1.005, 101), ("-2.5", -250), (7, 700),
+    ("", 0), (None, 0), ("abc", 0), ("nan", 0), ("inf", 0),
+    ("1e30", 10 ** 32), (1e30, 10 ** 32), ("1e26", 10 ** 28),
+])
+def test_to_paise(value, paise):
+    assert to_paise(value) == paise
+
+def test_huge_amounts_do_not_raise():
+    assert compute_total_from_charges([{"amount": "1e30"}]) == 1e30
+    row = {"name": "A", "date": "2025-01-01", "from_date": "2025-01-01", "to_date": "2025-01-31",
+           "charges": [{"type": "X", "amount": "1e30", "remark": ""}]}
+    assert normalize_row(row)["total"] == 1e30
+
+def test_format_paise():
+    assert format_paise(123450) == "1234.50"
+    assert format_paise(-5) == "-0.05"
+
+def test_printed_charge_lines_add_up_to_the_total():
+    charges = [{"type": "A", "amount": 1.005, "remark": ""}, {"type": "B", "amount": "1.005", "remark": ""}]
+    rows, amounts = _charge_rows({"charges": charges})
+    assert [row[2] for row in rows] == ["1.01", "1.01"]
+    assert sum(amounts) == to_paise(compute_total_from_charges(charges)) == 202
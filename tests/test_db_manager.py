@@ -0,0 +1,116 @@
+import httpx
+import pytest
+from api import db_manager
+from api.sqlite_backend import SqliteClient
+
+@pytest.fixture
+def empty_supabase():
+    """A real supabase client whose PostgREST answers every query with no rows."""
+    supabase = pytest.importorskip("supabase")
+
+    def handler(request):
+        if "application/vnd.pgrst.object+json" in request.headers.get("accept", ""):
+            return httpx.Response(406, json={"code": "PGRST116", "message": "JSON object requested, multiple (or no) rows returned"})
+        return httpx.Response(200, json=[])
+
+    http = httpx.Client(transport=httpx.MockTransport(handler))
+    return supabase.create_client("http://db.test", "service-role-key", supabase.ClientOptions(httpx_client=http))
+
+def test_fetch_one_returns_none_for_missing_row(empty_supabase):
+    assert db_manager.fetch_one(empty_supabase, 999) is None
+
+def test_update_of_missing_row_raises_lookup_error(empty_supabase):
+    with pytest.raises(LookupError):
+        db_manager.update_record_db(empty_supabase, 999, {"name": "x", "charges": []})
+
+def test_grand_total_includes_rows_without_a_stored_total():
+    rows = [
+        {"name": "stored", "total": 10.1},
+        {"name": "charges", "charges": [{"type": "A", "amount": 1.005}, {"type": "B", "amount": "abc"}, {"type": "C", "amount": "2"}]},
+        {"name": "legacy", "cf_charges": "5.5", "godown_rent": "12abc", "hamali_charges": " 1.004 "},
+        {"name": "empty charges", "charges": [], "labour_charges": "3"},
+    ]
+    db = SqliteClient(":memory:")
+    db.table("pdf_records").insert(rows).execute()
+    stored = db.table("pdf_records").select("*").execute().data
+    expected = sum(r["total"] if r["total"] is not None else db_manager.compute_total_from_charges(
+        db_manager.migrate_row_to_charges_if_needed(r)) for r in stored)
+    assert db_manager.fetch_grand_total(db) == round(expected, 2) == 22.61
+
+def test_unavailable_database_is_retried_by_execute_only(monkeypatch):
+    supabase = pytest.importorskip("supabase")
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(503, json={"code": "PGRST001", "message": "Database client error"})
+
+    http = httpx.Client(transport=httpx.MockTransport(handler))
+    client = supabase.create_client("http://db.test", "service-role-key", supabase.ClientOptions(httpx_client=http))
+    monkeypatch.setattr(db_manager, "DB_MAX_RETRIES", 2)
+    monkeypatch.setattr(db_manager, "DB_RETRY_BACKOFF_SECONDS", 0)
+    with pytest.raises(Exception):
+        db_manager.fetch_many(client, ids=[1])
+    assert len(requests) == 3
+
+def charge(i, amount=None):
+    return {"type": f"CHARGE {i}", "amount": amount if amount is not None else i + 1, "remark": ""}
+
+@pytest.fixture
+def patch_db(monkeypatch):
+    """An SQLite client holding record 1 (ten charges), recording the params of every RPC."""
+    db = SqliteClient(":memory:")
+    charges = [charge(i) for i in range(10)]
+    db.table("pdf_records").insert({"name": "Alpha", "date": "2025-01-31", "charges": charges,
+                                    "total": db_manager.compute_total_from_charges(charges)}).execute()
+    calls = []
+    rpc = db.rpc
+    monkeypatch.setattr(db, "rpc", lambda name, params=None: calls.append(params) or rpc(name, params))
+    db.calls = calls
+    return db
+
+def edit(db, **changes):
+    record = {k: v for k, v in db_manager.fetch_one(db, 1).items() if k in ("name", "date", "from_date", "to_date", "layout", "charges")}
+    record.update(changes)
+    record["total"] = db_manager.compute_total_from_charges(record["charges"])
+    return record
+
+def test_update_rejects_a_stale_expected_version(patch_db):
+    with pytest.raises(db_manager.StaleRecordError):
+        db_manager.update_record_db(patch_db, 1, edit(patch_db, name="Beta"), expected_version=2)
+    assert db_manager.fetch_one(patch_db, 1)["name"] == "Alpha"
+    assert patch_db.calls == []
+
+def test_update_rejects_a_record_changed_after_it_was_read(patch_db, monkeypatch):
+    stale = db_manager.fetch_one(patch_db, 1)
+    patch_db.table("pdf_records").update({"name": "Clerk", "version": 2}).eq("id", 1).execute()
+    monkeypatch.setattr(db_manager, "fetch_one", lambda supabase, record_id: stale)
+    with pytest.raises(db_manager.StaleRecordError):
+        db_manager.update_record_db(patch_db, 1, edit(patch_db, name="Beta"), expected_version=1)
+    monkeypatch.undo()
+    assert db_manager.fetch_one(patch_db, 1)["name"] == "Clerk"
+
+def test_update_sends_only_the_changed_fields(patch_db):
+    assert db_manager.update_record_db(patch_db, 1, edit(patch_db, name="Beta"), expected_version=1) == {"name": "Beta"}
+    assert patch_db.calls == [{"p_id": 1, "p_version": 1, "p_fields": {"name": "Beta"}}]
+    assert db_manager.update_record_db(patch_db, 1, edit(patch_db), expected_version=2) == {}
+    assert len(patch_db.calls) == 1
+    assert db_manager.fetch_one(patch_db, 1)["version"] == 2
+
+@pytest.mark.parametrize("change, expected_set", [
+    (lambda c: c[:3] + [charge(3, 99)] + c[4:], {"3": charge(3, 99)}),
+    (lambda c: c + [charge(10)], {"10": charge(10)}),
+    (lambda c: c[:8], {}),
+    (lambda c: c[:7] + [charge(7, 50)], {"7": charge(7, 50)}),
+])
+def test_update_rebuilds_charges_from_a_patch(patch_db, change, expected_set):
+    charges = change([charge(i) for i in range(10)])
+    changed = db_manager.update_record_db(patch_db, 1, edit(patch_db, charges=charges), expected_version=1)
+    assert changed["charges"] == charges
+    [params] = patch_db.calls
+    assert (params["p_charges_length"], params["p_charges_set"]) == (len(charges), expected_set)
+    assert "charges" not in params["p_fields"]
+    stored = db_manager.fetch_one(patch_db, 1)
+    assert stored["charges"] == charges
+    assert stored["total"] == db_manager.compute_total_from_charges(charges)
+    assert stored["version"] == 2
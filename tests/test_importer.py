@@ -0,0 +1,38 @@
+import sqlite3
+import httpx
+import pytest
+from api import importer
+from api.db_manager import upsert_records
+from api.sqlite_backend import SqliteClient
+
+def rows(n):
+    return [(line, {"name": f"C{line}", "date": "2025-01-01", "from_date": "2025-01-01", "to_date": "2025-01-31",
+                    "charges": [], "total": 0.0}) for line in range(1, n + 1)]
+
+def count(db):
+    return len(db.table("pdf_records").select("id").execute().data)
+
+def test_batch_resent_after_lost_response_adds_no_duplicates(monkeypatch):
+    db = SqliteClient(":memory:")
+
+    def lost_response(supabase, keyed):
+        upsert_records(supabase, keyed)
+        raise httpx.ReadTimeout("response lost")
+
+    monkeypatch.setattr(importer, "upsert_records", lost_response)
+    with pytest.raises(httpx.ReadTimeout):
+        importer._flush(db, rows(3), [])
+    monkeypatch.setattr(importer, "upsert_records", upsert_records)
+    assert importer._flush(db, rows(3), []) == 0
+    assert count(db) == 3
+
+def test_rejected_batch_is_retried_row_by_row(monkeypatch):
+    db = SqliteClient(":memory:")
+
+    def reject(supabase, keyed):
+        raise sqlite3.IntegrityError("rejected")
+
+    monkeypatch.setattr(importer, "upsert_records", reject)
+    errors = []
+    assert importer._flush(db, rows(2), errors) == 2
+    assert errors == [] and count(db) == 2
@@ -0,0 +1,22 @@
+import cProfile
+import logging
+from api import metrics
+
+def test_record_error_counts_and_logs_without_printing(caplog, capsys):
+    with caplog.at_level(logging.ERROR, logger="api.metrics"):
+        metrics.record_error("test_op", ValueError("boom"))
+    assert 'invoiceforge_errors_total{error="ValueError",operation="test_op"} 1' in metrics.render_metrics()
+    assert "test_op failed: boom" in caplog.text
+    assert capsys.readouterr() == ("", "")
+
+def test_save_profile_writes_the_file_and_logs_its_path(tmp_path, monkeypatch, caplog, capsys):
+    monkeypatch.setattr(metrics, "PROFILE_DIR", str(tmp_path))
+    profiler = cProfile.Profile()
+    profiler.enable()
+    sum(range(100))
+    profiler.disable()
+    with caplog.at_level(logging.INFO, logger="api.metrics"):
+        name = metrics.save_profile(profiler, "GET /records")
+    assert (tmp_path / name).is_file()
+    assert str(tmp_path / name) in caplog.text
+    assert capsys.readouterr() == ("", "")
@@ -0,0 +1,41 @@
+import sqlite3
+from api import db_manager
+from api.metrics import render_gauge
+from api.outbox import Outbox
+
+def failing_write(exc):
+    def write(key, record):
+        raise exc
+    return write
+
+def test_rejected_write_is_parked_not_rescheduled(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.sqlite3"), failing_write(sqlite3.IntegrityError("NOT NULL constraint failed")),
+                    retry_seconds=0, is_rejection=db_manager.is_rejection)
+    outbox.add("k1", {"name": "A"})
+    assert outbox.deliver("k1", {"name": "A"}) is False
+    assert outbox.status("k1") == "rejected"
+    assert outbox.due() == []
+    assert outbox.counts() == {"rejected": 1}
+    [entry] = outbox.rejected()
+    assert (entry["key"], entry["record"], entry["attempts"]) == ("k1", {"name": "A"}, 1)
+    assert "NOT NULL" in entry["last_error"]
+
+def test_transport_failure_stays_pending(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.sqlite3"), failing_write(ConnectionError("reset")),
+                    retry_seconds=0, is_rejection=db_manager.is_rejection)
+    outbox.add("k1", {"name": "A"})
+    assert outbox.deliver("k1", {"name": "A"}) is False
+    assert outbox.status("k1") == "pending"
+    assert outbox.pending_count() == 1
+
+def test_outbox_created_before_parking_gains_the_status_column(tmp_path):
+    path = str(tmp_path / "outbox.sqlite3")
+    with sqlite3.connect(path) as conn:
+        conn.execute("create table outbox (key text primary key, payload text not null, attempts integer not null default 0,"
+                     " last_error text, created_at real not null, next_attempt_at real not null)")
+        conn.execute("insert into outbox (key, payload, created_at, next_attempt_at) values ('old', '{}', 0, 0)")
+    outbox = Outbox(path, lambda key, record: None)
+    assert outbox.due() == [("old", {})]
+
+def test_render_gauge():
+    assert render_gauge("g", "Help.", [({"status": "pending"}, 2)]) == '# HELP g Help.\n# TYPE g gauge\ng{status="pending"} 2\n'
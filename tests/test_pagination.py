@@ -0,0 +1,37 @@
+import pytest
+from api.layouts import compile_layout
+from api.pdf_generator import paginate_rows
+
+def minimal_spec(bottom):
+    return {
+        "fields": {},
+        "table": {
+            "left": 0, "top": 100, "bottom": bottom, "column_widths": [10, 10, 10, 10], "row_height": 10,
+            "header": ["SR", "PARTICULAR", "AMOUNT", "REMARK"], "font": "Times-Roman", "bold_font": "Times-Bold",
+            "font_size": 10, "header_font_size": 11,
+        },
+        "note": {"lines": [], "gap": 0},
+    }
+
+def test_rejects_table_too_small_for_a_continuation_page():
+    with pytest.raises(ValueError):
+        compile_layout(minimal_spec(bottom=70), "tiny", ".")  # 3 rows
+
+@pytest.mark.parametrize("num_rows", range(0, 25))
+def test_minimal_layout_pages_cover_every_row(num_rows):
+    plan = compile_layout(minimal_spec(bottom=60), "minimal", ".")  # 4 rows per page
+    pages = paginate_rows(num_rows, plan)
+    assert pages[0][0] == 0 and pages[-1][1] == num_rows
+    for (_, end), (start, _) in zip(pages, pages[1:]):
+        assert end == start
+    for page_no, (start, end) in enumerate(pages):
+        fixed = 3 if page_no else 2
+        capacity = plan["max_rows_last"] if page_no == len(pages) - 1 else plan["max_rows"]
+        assert end - start + fixed <= capacity
+        if page_no < len(pages) - 1:
+            assert end > start
+
+def test_paginate_rows_raises_instead_of_looping():
+    plan = {"name": "broken", "max_rows": 3, "max_rows_last": 3}
+    with pytest.raises(ValueError):
+        paginate_rows(3, plan)
@@ -0,0 +1,33 @@
+import io
+import os
+from PyPDF2 import PdfReader
+from api.pdf_generator import fill_pdf_with_overlay
+from api.pdf_stream import stream_merged_pdf
+
+TEMPLATE = os.path.join(os.path.dirname(__file__), "..", "template.pdf")
+
+def invoice(name, charges):
+    return {
+        "name": f"{name}\nMarket Road", "date": "2025-01-31", "from_date": "2025-01-01", "to_date": "2025-01-31",
+        "charges": [{"type": f"CHARGE {i}", "amount": i + 1, "remark": ""} for i in range(charges)],
+        "total": sum(range(1, charges + 1)),
+    }
+
+def test_streamed_merge_is_a_valid_pdf_with_every_page():
+    records = [invoice("Alpha", 3), invoice("Beta", 30), invoice("Gamma", 5)]
+    pdfs = [fill_pdf_with_overlay(TEMPLATE, r).getvalue() for r in records]
+    page_counts = [len(PdfReader(io.BytesIO(pdf)).pages) for pdf in pdfs]
+    assert page_counts[1] > 1  # the long invoice continues on a second page
+
+    merged = PdfReader(io.BytesIO(b"".join(stream_merged_pdf(iter(pdfs)))), strict=True)
+    assert len(merged.pages) == sum(page_counts)
+    texts = [page.extract_text() for page in merged.pages]
+    first = 0
+    for record, count in zip(records, page_counts):
+        pages = texts[first:first + count]
+        assert all(record["name"].split("\n")[0] in text for text in pages)
+        assert f"{record['total']:.2f}" in pages[-1]
+        if count > 1:
+            assert "CARRIED FORWARD" in pages[0] and "BROUGHT FORWARD" in pages[1]
+            assert f"Page {count} of {count}" in pages[-1]
+        first += count
@@ -0,0 +1,69 @@
+import os
+from types import SimpleNamespace
+import pytest
+
+os.environ.setdefault("DB_BACKEND", "sqlite")
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    from api import index
+    from api.sqlite_backend import SqliteClient
+    monkeypatch.setattr(index, "get_job_queue", lambda: SimpleNamespace(submit=lambda selection: "job-1"))
+    db = SqliteClient(":memory:")
+    monkeypatch.setattr(index, "get_client", lambda: db)
+    return index.app.test_client()
+
+@pytest.mark.parametrize("body", [{"ids": [1, 2]}, {"ids": "1, 2"}, {"record_id": 1}])
+def test_jobs_accepts_json_and_form_ids(client, body):
+    assert client.post("/jobs", json=body).status_code == 202
+
+def test_jobs_rejects_bad_ids(client):
+    assert client.post("/jobs", json={"ids": ["x"]}).status_code == 400
+    assert client.post("/jobs", data={"ids": "1,x"}).status_code == 400
+
+def test_records_total_follows_the_search(client):
+    from api import index
+    index.get_client().table("pdf_records").insert([
+        {"name": "Alpha Traders", "date": "2025-01-10", "total": 100.0, "charges": [{"type": "Godown Rent", "amount": 100}]},
+        {"name": "Beta Stores", "date": "2025-02-10", "total": 20.5, "charges": [{"type": "Courier", "amount": 20.5}]},
+        {"name": "Alpha Legacy", "date": "2025-03-10", "cf_charges": "7.25"},
+    ]).execute()
+    assert "Grand Total: 127.75" in client.get("/records").get_data(as_text=True)
+    assert "Total of matching records: 107.25" in client.get("/records?q=alpha").get_data(as_text=True)
+    assert "Total of matching records: 20.50" in client.get("/records?date_from=2025-02-01&date_to=2025-02-28").get_data(as_text=True)
+    assert "Total of matching records: 100.00" in client.get("/records?charge_type=godown rent").get_data(as_text=True)
+    assert "Total of matching records: 120.50" in client.get("/records?total_min=10").get_data(as_text=True)
+
+def test_report_totals_match_the_grand_total(client):
+    from api import index
+    index.get_client().table("pdf_records").insert([
+        {"name": "Legacy\nMarket Road", "date": "2025-01-05", "cf_charges": "500", "hamali_charges": ""},
+        {"name": "New", "date": "2025-01-20", "total": 100.01,
+         "charges": [{"type": "Godown Rent", "amount": 100.005}]},
+    ]).execute()
+    assert "Grand Total: 600.01" in client.get("/records").get_data(as_text=True)
+    by_month = client.get("/reports/totals?group_by=month").get_json()
+    assert by_month["rows"] == [{"bucket": "2025-01", "invoices": 2, "total": 600.01}]
+    by_customer = client.get("/reports/totals?group_by=customer").get_json()
+    assert {r["bucket"]: r["total"] for r in by_customer["rows"]} == {"Legacy": 500.0, "New": 100.01}
+    by_type = client.get("/reports/totals?group_by=charge_type").get_json()
+    assert {r["bucket"]: (r["invoices"], r["total"]) for r in by_type["rows"]} == {
+        "C & F CHARGES": (1, 500.0), "GODOWN RENT": (1, 100.01),
+    }
+    assert by_type["total"] == by_month["total"] == 600.01
+
+@pytest.mark.parametrize("query", ["date_from=foo", "date_to=2025-13-01", "date_from=01-02-2025"])
+def test_report_totals_rejects_malformed_dates(client, query):
+    response = client.get(f"/reports/totals?group_by=month&{query}")
+    assert response.status_code == 400
+    assert "YYYY-MM-DD" in response.get_json()["error"]
+
+def test_print_falls_back_when_the_stored_layout_is_gone(client, caplog):
+    from api import index
+    index.get_client().table("pdf_records").insert([
+        {"name": "Old", "date": "2025-01-05", "total": 10.0, "charges": [{"type": "Courier", "amount": 10}], "layout": "retired"},
+    ]).execute()
+    response = client.get("/print/1")
+    assert response.status_code == 200
+    assert response.data.startswith(b"%PDF")
+    assert "Layout 'retired' of a stored record is unusable" in caplog.text
@@ -0,0 +1,31 @@
+import json
+import os
+import subprocess
+import sys
+from benchmarks.startup import DEFAULT_FORBID, ROOT, import_times, summarize
+
+# Generous, so the check flags only gross regressions on a slow CI runner (the app imports in ~250 ms here).
+IMPORT_BUDGET_MS = 2000
+
+def test_importing_the_app_stays_cheap(tmp_path):
+    """`import api.index` (every cold start) must not load the database/PDF stacks or touch disk."""
+    env = {**os.environ, "OUTBOX_PATH": str(tmp_path / "outbox.sqlite3"), "JOBS_DIR": str(tmp_path / "jobs")}
+    code = (
+        "import json, sys, threading, api.index; "
+        "print(json.dumps({'modules': sorted(sys.modules), 'threads': threading.active_count()}))"
+    )
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    forbidden = DEFAULT_FORBID.split(",")
+    loaded = [m for m in result["modules"] if m.split(".")[0] in forbidden]
+    assert loaded == []
+    assert result["threads"] == 1
+    assert list(tmp_path.iterdir()) == []
+
+def test_importtime_report_is_within_budget():
+    """The same -X importtime summary `python -m benchmarks.startup` prints and checks."""
+    report = summarize(import_times("api.index"), "api.index", top=10)
+    assert "api" in report["modules"] and "flask" in report["modules"]
+    assert [m for m in DEFAULT_FORBID.split(",") if m in report["modules"]] == []
+    assert 0 < report["total_ms"] < IMPORT_BUDGET_MS
+    assert report["by_package_ms"]